@@ -0,0 +1,122 @@
+import os
+import logging
+from functools import lru_cache
+from typing import Iterable, Optional, Set
+
+import pandas as pd
+
+from manifest import DEFAULT_PROPERTY
+from rate_store import AVERAGE_COLUMN, OWN_RATE_COLUMN, competitor_columns, load_rate_table, store_path
+
+# Columns of the materialized per-date rate-position table
+COMP_MIN = "Comp Min"
+COMP_MEDIAN = "Comp Median"
+COMP_MAX = "Comp Max"
+COMP_SET_SIZE = "Comp Set Size"
+OWN_RANK = "Rank"
+RATE_GAP = "Rate Gap"
+RATE_GAP_PCT = "Rate Gap %"
+ROLLING_WINDOWS = {"7d": "7D", "28d": "28D"}
+
+def _rolling_column(column: str, window: str) -> str:
+    return f"{column} {window} Avg"
+
+def compute_aggregates(table: pd.DataFrame) -> pd.DataFrame:
+    """
+    Computes the per-date rate-position table: comp set min/median/mean/max, own rate rank
+    (1 = cheapest, ties share the best rank), gap in absolute and % terms, number of
+    competitors with a rate, and rolling 7/28-day averages of own and comp set rates.
+    """
+    comp_rates = table[competitor_columns(table)]
+    own_rate = table[OWN_RATE_COLUMN]
+    aggregates = pd.DataFrame(index=table.index)
+    aggregates[OWN_RATE_COLUMN] = own_rate
+    aggregates[COMP_MIN] = comp_rates.min(axis=1)
+    aggregates[COMP_MEDIAN] = comp_rates.median(axis=1)
+    aggregates[AVERAGE_COLUMN] = comp_rates.mean(axis=1)
+    aggregates[COMP_MAX] = comp_rates.max(axis=1)
+    aggregates[COMP_SET_SIZE] = comp_rates.notna().sum(axis=1)
+    aggregates[OWN_RANK] = comp_rates.lt(own_rate, axis=0).sum(axis=1) + 1
+    aggregates.loc[own_rate.isna(), OWN_RANK] = float("nan")
+    aggregates[RATE_GAP] = own_rate - aggregates[AVERAGE_COLUMN]
+    aggregates[RATE_GAP_PCT] = aggregates[RATE_GAP] / aggregates[AVERAGE_COLUMN] * 100
+    for label, window in ROLLING_WINDOWS.items():
+        aggregates[_rolling_column(OWN_RATE_COLUMN, label)] = own_rate.rolling(window).mean()
+        aggregates[_rolling_column(AVERAGE_COLUMN, label)] = aggregates[AVERAGE_COLUMN].rolling(window).mean()
+    return aggregates.round(2)
+
+def refresh_aggregates(table: pd.DataFrame, previous: Optional[pd.DataFrame],
+                       changed_dates: Iterable[pd.Timestamp]) -> pd.DataFrame:
+    """
+    Incrementally refreshes a materialized aggregate table: only changed dates and the dates
+    whose rolling windows cover them are recomputed; rows for removed dates are dropped.
+    Removed dates must be included in `changed_dates` since they shift later rolling windows.
+    """
+    changed = pd.DatetimeIndex(sorted(set(changed_dates)))
+    if previous is None or previous.empty:
+        return compute_aggregates(table)
+    previous = previous[previous.index.isin(table.index)]
+    if changed.empty:
+        return previous
+
+    longest_window = max(pd.Timedelta(window) for window in ROLLING_WINDOWS.values())
+    # A changed date affects its own row and every rolling window that ends within the longest window after it
+    latest_change = changed.searchsorted(table.index, side="right") - 1
+    affected = (latest_change >= 0) & (table.index - changed[latest_change.clip(min=0)] < longest_window)
+    if not affected.any():
+        return previous
+    affected_dates = table.index[affected]
+    # Recompute over a slice that starts one full window earlier so rolling means are exact
+    window_slice = table.loc[affected_dates.min() - longest_window:]
+    recomputed = compute_aggregates(window_slice)
+    recomputed = recomputed[recomputed.index.isin(affected_dates)]
+
+    refreshed = pd.concat([previous[~previous.index.isin(recomputed.index)], recomputed]).sort_index()
+    logging.info(f"Refreshed {len(recomputed)} of {len(refreshed)} aggregate rows.")
+    return refreshed
+
+def save_aggregates(aggregates: pd.DataFrame, file_name: str, property_id: str = DEFAULT_PROPERTY):
+    path = store_path(file_name, property_id, kind="aggregates")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    aggregates.to_parquet(path)
+
+@lru_cache(maxsize=32)
+def _read_aggregates(path: str, mtime: float) -> pd.DataFrame:
+    return pd.read_parquet(path)
+
+def load_aggregates(file_name: str, property_id: str = DEFAULT_PROPERTY) -> Optional[pd.DataFrame]:
+    """Loads the materialized aggregate table of a file, or None if it was never materialized."""
+    path = store_path(file_name, property_id, kind="aggregates")
+    if not os.path.exists(path):
+        return None
+    return _read_aggregates(path, os.path.getmtime(path))
+
+def load_property_aggregates(file_names: Iterable[str], property_id: str = DEFAULT_PROPERTY) -> Optional[pd.DataFrame]:
+    """Loads and combines the aggregate tables of several files of one property."""
+    tables = [
+        aggregates for aggregates in (load_aggregates(name, property_id) for name in sorted(set(file_names)))
+        if aggregates is not None
+    ]
+    if not tables:
+        return None
+    combined = pd.concat(tables) if len(tables) > 1 else tables[0]
+    return combined[~combined.index.duplicated(keep="last")].sort_index()
+
+def delete_aggregates(file_name: str, property_id: str = DEFAULT_PROPERTY):
+    path = store_path(file_name, property_id, kind="aggregates")
+    if os.path.exists(path):
+        os.remove(path)
+
+def materialize_aggregates(file_name: str, property_id: str = DEFAULT_PROPERTY,
+                           changed_dates: Optional[Set[str]] = None):
+    """
+    Materializes (or incrementally refreshes) the aggregate table of an ingested file from
+    its stored rate table. `changed_dates` are ISO dates of new or changed rows; None means
+    recompute everything. Removed dates count as changed.
+    """
+    table = load_rate_table(file_name, property_id)
+    if table is None:
+        return
+    previous = load_aggregates(file_name, property_id) if changed_dates is not None else None
+    dates = pd.to_datetime(sorted(changed_dates)) if changed_dates else []
+    save_aggregates(refresh_aggregates(table, previous, dates), file_name, property_id)
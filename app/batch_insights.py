@@ -0,0 +1,157 @@
+"""
+Headless batch insights for nightly portfolio runs.
+
+Computes the same overpriced/underpriced/restriction insights as the Streamlit app for
+every comp set file in a directory (one file per property), fanning the work out across
+a process pool, and writes one record per property and question to Parquet or JSON.
+
+Usage (from the directory containing config.yaml):
+
+    python app/batch_insights.py rate_shops/ --output insights.parquet
+    python app/batch_insights.py rate_shops/ --questions questions.txt --narrative --output insights.json
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Optional
+
+import pandas as pd
+
+from intents import route_question
+from rate_store import build_rate_table, read_comp_set
+
+DEFAULT_QUESTIONS = [
+    "Which days am I overpriced?",
+    "Which days am I underpriced?",
+    "What is the highest competitor rate recorded?",
+    "Which days have the lowest competitor rates?",
+    "Which days have a Min LOS restriction?",
+    "What are the Advance Purchase restrictions?",
+    "Where do I rank against the comp set?",
+]
+
+def load_questions(path: Optional[str]) -> List[str]:
+    """Loads a question set from a JSON list or a text file with one question per line."""
+    if not path:
+        return DEFAULT_QUESTIONS
+    with open(path, "r") as f:
+        if path.endswith(".json"):
+            return json.load(f)
+        return [line.strip() for line in f if line.strip()]
+
+def find_comp_set_files(input_dir: str) -> List[str]:
+    return sorted(
+        os.path.join(input_dir, name) for name in os.listdir(input_dir)
+        if name.endswith((".csv", ".xlsx"))
+    )
+
+def process_property(path: str, questions: List[str]) -> List[dict]:
+    """Parses one property's comp set file and answers every question from its rate table."""
+    property_id = os.path.splitext(os.path.basename(path))[0]
+    started = time.perf_counter()
+    try:
+        table = build_rate_table(read_comp_set(path))
+    except Exception as e:
+        logging.error(f"Skipping '{path}': {e}")
+        return [{"property_id": property_id, "file": path, "question": None, "status": "error", "error": str(e)}]
+
+    records = []
+    for question in questions:
+        record = {"property_id": property_id, "file": path, "question": question, "dates": len(table)}
+        try:
+            result = route_question(question, table)
+        except Exception as e:
+            # One unanswerable question (e.g. no competitor rates at all) must not fail the property
+            logging.error(f"Question '{question}' failed for '{path}': {e}")
+            records.append({**record, "status": "error", "error": str(e)})
+            continue
+        record["status"] = "answered" if result is not None else "no_intent"
+        if result is not None:
+            record.update({
+                "intent": result.intent,
+                "summary": result.summary,
+                "row_count": len(result.frame),
+                "rows_csv": result.frame.to_csv(index=False),
+            })
+        records.append(record)
+    elapsed = time.perf_counter() - started
+    for record in records:
+        record["compute_seconds"] = round(elapsed / len(records), 6)
+    return records
+
+def add_narratives(records: List[dict], concurrency: int, language: str = "en"):
+    """Adds a short LLM narrative to answered records, with at most `concurrency` Ollama calls in flight."""
+    from llm_interface import NARRATIVE_PROMPT, call_llm
+
+    def narrate(record: dict) -> str:
+        context = "\n".join(record["rows_csv"].splitlines()[:51])
+        return "".join(call_llm(context, NARRATIVE_PROMPT.format(question=record["question"]), language))
+
+    answered = [record for record in records if record.get("row_count")]
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="narrative") as executor:
+        for record, narrative in zip(answered, executor.map(narrate, answered)):
+            record["narrative"] = narrative
+
+def write_results(records: List[dict], output: str):
+    frame = pd.DataFrame.from_records(records)
+    if output.endswith(".parquet"):
+        frame.to_parquet(output, index=False)
+    else:
+        frame.to_json(output, orient="records", indent=2)
+
+def run_batch(input_dir: str, questions: List[str], output: str, workers: Optional[int] = None,
+              narrative: bool = False, llm_concurrency: int = 2) -> dict:
+    """Runs the batch over every comp set file in `input_dir` and returns throughput statistics."""
+    files = find_comp_set_files(input_dir)
+    workers = workers or os.cpu_count() or 1
+    started = time.perf_counter()
+    records: List[dict] = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for property_records in executor.map(process_property, files, [questions] * len(files)):
+            records.extend(property_records)
+    compute_seconds = time.perf_counter() - started
+
+    if narrative:
+        add_narratives(records, llm_concurrency)
+    write_results(records, output)
+
+    total_seconds = time.perf_counter() - started
+    stats = {
+        "properties": len(files),
+        "questions": len(questions),
+        "workers": workers,
+        "compute_seconds": round(compute_seconds, 3),
+        "total_seconds": round(total_seconds, 3),
+        "properties_per_minute": round(len(files) / compute_seconds * 60, 1) if compute_seconds > 0 else None,
+        "output": output,
+    }
+    logging.info("Batch insights: " + json.dumps(stats))
+    return stats
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Compute comp set insights for every property in a directory.")
+    parser.add_argument("input_dir", help="Directory of comp set files (.csv/.xlsx), one per property")
+    parser.add_argument("--questions", help="Question set: JSON list or text file with one question per line")
+    parser.add_argument("--output", default="insights.parquet", help="Output file (.parquet or .json)")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: number of CPUs)")
+    parser.add_argument("--narrative", action="store_true", help="Add a short LLM narrative to each answer")
+    parser.add_argument("--llm-concurrency", type=int, default=2, help="Maximum concurrent Ollama requests")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    stats = run_batch(
+        args.input_dir,
+        load_questions(args.questions),
+        args.output,
+        workers=args.workers,
+        narrative=args.narrative,
+        llm_concurrency=args.llm_concurrency,
+    )
+    print(json.dumps(stats, indent=2))
+
+if __name__ == "__main__":
+    sys.exit(main())
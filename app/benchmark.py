@@ -0,0 +1,442 @@
+"""
+Offline benchmark of ingest, retrieval, context extraction and end-to-end answers.
+
+Synthetic comp sets of each size are ingested into a throwaway workspace (its own vector
+store, rate store, manifest and caches) using a deterministic hashing embedding function
+and a stub LLM, so no Ollama server is needed and runs are comparable between releases.
+The report is sorted JSON, meant to be diffed or passed back as `--baseline`.
+
+Usage (from the directory containing config.yaml):
+
+    python app/benchmark.py --output benchmark.json
+    python app/benchmark.py --sizes 1000 10000 --baseline benchmark.json --output benchmark-new.json
+"""
+import io
+import os
+import re
+import sys
+import json
+import time
+import zlib
+import shutil
+import logging
+import subprocess
+import argparse
+import platform
+import tempfile
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import yaml
+
+from embeddings import PooledOllamaEmbeddingFunction
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data"))
+from generate_data import generate_comp_set  # noqa: E402
+
+REPORT_VERSION = 1
+DEFAULT_SIZES = [1000, 10000, 100000]
+# Early enough that 100k consecutive stay dates stay within pandas' timestamp range
+START_DATE = "1950-01-01"
+
+# Questions the intent router answers exactly, and open questions that go through retrieval and the LLM
+INTENT_QUESTIONS = [
+    "Which days am I overpriced?",
+    "Where do I rank against the comp set?",
+    "Which days have a Min LOS restriction?",
+]
+RETRIEVAL_QUESTIONS = [
+    "How did competitor prices move between 1950-02-01 and 1950-02-14?",
+    "Summarize my pricing position in March.",
+    "Are weekend rates priced differently from weekdays?",
+    "What should I change about my pricing strategy?",
+]
+
+class HashingEmbeddingFunction(PooledOllamaEmbeddingFunction):
+    """Deterministic bag-of-words embedding: tokens are hashed into buckets and L2-normalized."""
+
+    def __init__(self, dimensions: int = 64):
+        super().__init__(url="http://localhost/stub", model_name="stub-embedding")
+        self.dimensions = dimensions
+
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in input]
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dimensions)
+        for token in re.findall(r"[a-z0-9]+", text.lower()):
+            vector[zlib.crc32(token.encode()) % self.dimensions] += 1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+class StubOllama:
+    """Stands in for the `ollama` module: streams a fixed-length answer echoing the prompt."""
+
+    def __init__(self, answer_tokens: int = 64):
+        self.answer_tokens = answer_tokens
+
+    def chat(self, model: str, messages: List[dict], stream: bool = False, **kwargs):
+        prompt = messages[-1]["content"]
+        words = prompt.split() or ["empty"]
+        tokens = [words[i % len(words)] + " " for i in range(self.answer_tokens)]
+        if not stream:
+            return {"message": {"content": "".join(tokens)}, "done": True}
+        chunks = [{"done": False, "message": {"content": token}} for token in tokens]
+        chunks.append({"done": True, "message": {"content": ""}, "prompt_eval_count": (len(prompt) + 3) // 4,
+                       "eval_count": len(tokens)})
+        return iter(chunks)
+
+    def generate(self, model: str, prompt: str = "", **kwargs):
+        return {"response": "", "done": True}
+
+    def AsyncClient(self, *args, **kwargs) -> "StubOllama":
+        return _AsyncStubOllama(self.answer_tokens)
+
+class _AsyncStubOllama(StubOllama):
+    async def chat(self, model: str, messages: List[dict], stream: bool = False, **kwargs):
+        response = StubOllama.chat(self, model, messages, stream, **kwargs)
+        if not stream:
+            return response
+
+        async def chunks():
+            for chunk in response:
+                yield chunk
+        return chunks()
+
+def prepare_workspace(workspace: str, config_path: str = "config.yaml") -> str:
+    """Writes a config.yaml into the workspace that keeps every store inside it."""
+    with open(config_path, "r") as f:
+        config = yaml.safe_load(f) or {}
+    config.update({
+        "vector_store_path": os.path.join(workspace, "vector_store"),
+        "rate_store_path": os.path.join(workspace, "rate_store"),
+        "manifest_path": os.path.join(workspace, "manifest.json"),
+        "row_hash_store_path": os.path.join(workspace, "row_hashes"),
+        "cache_path": os.path.join(workspace, "cache.sqlite3"),
+        "lexical_index_path": os.path.join(workspace, "lexical_index.sqlite3"),
+        "snapshot_store_path": os.path.join(workspace, "snapshots"),
+        "embedding_model": "stub-embedding",
+        "translation_backend": "native",
+        "metrics_port": None,
+    })
+    with open(os.path.join(workspace, "config.yaml"), "w") as f:
+        yaml.safe_dump(config, f)
+    return workspace
+
+def install_stubs(embedding_dimensions: int = 64, answer_tokens: int = 64):
+    """Replaces the Ollama embedding function and chat client with the offline stubs."""
+    import llm_interface
+    import vector_store
+
+    vector_store._embedding_function = HashingEmbeddingFunction(embedding_dimensions)
+    # The app imports ollama on first use, so the stub has to take the module's place
+    sys.modules["ollama"] = StubOllama(answer_tokens)
+    llm_interface._async_client = None
+
+def _latency(fn: Callable[[], object], repeats: int) -> Dict[str, float]:
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return {
+        "median_ms": round(float(np.median(timings)), 3),
+        "p95_ms": round(float(np.percentile(timings, 95)), 3),
+        "min_ms": round(min(timings), 3),
+    }
+
+def _upload(df: pd.DataFrame, file_name: str) -> io.BytesIO:
+    upload = io.BytesIO(df.to_csv(index=False, float_format="%g").encode())
+    upload.name = file_name
+    return upload
+
+def _timed_ingest(df: pd.DataFrame, file_name: str, property_id: str) -> dict:
+    from ingest import ingest_document
+    from telemetry import start_trace
+
+    with start_trace("ingest") as trace:
+        started = time.perf_counter()
+        outcome = ingest_document(_upload(df, file_name), property_id)
+        seconds = time.perf_counter() - started
+    if outcome is None:
+        raise RuntimeError(f"Ingest of '{file_name}' failed")
+    return {
+        "seconds": round(seconds, 4),
+        "rows_per_second": round(len(df) / seconds, 1) if seconds > 0 else None,
+        "changed_rows": outcome["changed"],
+        "stages": {name: round(seconds, 4) for name, seconds in sorted(trace.stage_seconds.items())},
+    }
+
+def answer_question(question: str, property_id: str, n_results: int, model: str) -> str:
+    """The app's question flow without the UI: intent router, else retrieval, context packing and the LLM."""
+    from aggregates import load_property_aggregates
+    from intents import route_question
+    from llm_interface import call_llm
+    from rate_store import load_rate_tables
+    from service import prepare_answer
+    from vector_store import list_uploaded_documents
+
+    documents = list_uploaded_documents(property_id)
+    result = route_question(
+        question, load_rate_tables(documents, property_id), load_property_aggregates(documents, property_id)
+    )
+    if result is not None:
+        return result.summary
+    prepared = prepare_answer(question, property_id, n_results, model)
+    return "".join(call_llm(prepared.context, question, "en")) if prepared else ""
+
+# Heavy dependencies whose loading at app start the startup benchmark reports. chromadb,
+# langchain and ollama should only load on first use; pandas (about half the import time)
+# is expected here, since the first page render already needs it for the rate alerts
+HEAVY_MODULES = ["chromadb", "langchain", "ollama", "pandas"]
+
+# Runs in a fresh interpreter inside the workspace: argv is question, property_id, n_results, warm
+STARTUP_PROBE = """
+import sys, json, time
+question, property_id, n_results, warm = sys.argv[1], sys.argv[2], int(sys.argv[3]), sys.argv[4] == "1"
+started = time.perf_counter()
+import main_app
+result = {"import_seconds": time.perf_counter() - started}
+result["loaded_at_import"] = sorted(m for m in json.loads(sys.argv[5]) if m in sys.modules)
+started = time.perf_counter()
+import benchmark
+benchmark.install_stubs()
+if warm:
+    from warmup import warm_up
+    result["warm_up"] = warm_up()
+    result["warm_up_seconds"] = time.perf_counter() - started
+    started = time.perf_counter()
+benchmark.answer_question(question, property_id, n_results, main_app.config["llm_model"])
+result["first_answer_seconds"] = time.perf_counter() - started
+print(json.dumps(result))
+"""
+
+def benchmark_startup(property_id: str, n_results: int, warm: bool) -> dict:
+    """
+    Measures a fresh process: how long importing the app takes, which heavy modules that
+    loads eagerly, and the time to the first answer, cold or after `warm_up()`.
+    """
+    app_dir = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [app_dir, os.environ.get("PYTHONPATH")])))
+    completed = subprocess.run(
+        [sys.executable, "-c", STARTUP_PROBE, RETRIEVAL_QUESTIONS[0], property_id, str(n_results),
+         "1" if warm else "0", json.dumps(HEAVY_MODULES)],
+        cwd=os.getcwd(), env=env, capture_output=True, text=True, check=True,
+    )
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    return {key: round(value, 4) if isinstance(value, float) else value for key, value in result.items()}
+
+def retrieval_precision(df: pd.DataFrame, file_name: str, property_id: str, n_results: int, seed: int,
+                        samples: int = 20) -> dict:
+    """
+    Share of retrieved records that are the asked-for row (precision) and of questions whose
+    row was retrieved at all (hit rate), for questions naming one stay date or one exact
+    competitor rate, with vector search alone and with hybrid retrieval.
+    """
+    from manifest import document_id
+    from retrieval import retrieve
+    from vector_store import query_collection
+
+    rng = np.random.default_rng(seed)
+    rows = df.iloc[rng.choice(len(df), min(samples, len(df)), replace=False)]
+    competitor = next(col for col in df.columns if col.startswith("Competitor ") and col != "Competitor Rates")
+    questions = [(f"What were the rates on {row['Date']}?", document_id(file_name, row["Date"])) for _, row in rows.iterrows()]
+    # Rates shared by several days are ambiguous; only ask about ones that identify a single day
+    unique_rates = df[competitor].dropna()[~df[competitor].dropna().duplicated(keep=False)]
+    questions += [
+        (f"On which day did {competitor.removesuffix(' Rate')} charge {rate:g}?", document_id(file_name, df.loc[index, "Date"]))
+        for index, rate in unique_rates.head(samples).items()
+    ]
+
+    precision = {}
+    for name, search in (("vector", query_collection), ("hybrid", retrieve)):
+        hits = 0
+        for question, expected_id in questions:
+            results = search(question, n_results, property_id=property_id)
+            hits += expected_id in results["ids"][0]
+        precision[name] = {
+            "precision": round(hits / (len(questions) * n_results), 4),
+            "hit_rate": round(hits / len(questions), 4),
+        }
+    return precision
+
+def benchmark_size(rows: int, competitors: int, seed: int, repeats: int, n_results: int,
+                   missing_rate: float, outlier_rate: float) -> dict:
+    """Benchmarks one dataset size in its own property namespace."""
+    from aggregates import load_property_aggregates
+    from context_builder import build_context
+    from question_filters import build_where_filter
+    from rate_store import load_rate_tables
+    from retrieval import retrieve
+    from utils import extract_relevant_context
+    from vector_store import config
+
+    property_id = f"bench-{rows}"
+    file_name = f"comp_set_{rows}.csv"
+    df = generate_comp_set(rows, competitors, START_DATE, seed, missing_rate, outlier_rate)
+    result = {"rows": rows, "competitors": competitors}
+
+    result["ingest"] = _timed_ingest(df, file_name, property_id)
+    # Re-upload with 1% of the own rates changed: only those rows should be re-embedded
+    changed = df.copy()
+    changed.loc[::100, "Your Rate"] += 1
+    result["ingest_incremental"] = _timed_ingest(changed, file_name, property_id)
+
+    table = load_rate_tables([file_name], property_id)
+    aggregates = load_property_aggregates([file_name], property_id)
+    retrieval, context, extraction, end_to_end = {}, {}, {}, {}
+    for question in RETRIEVAL_QUESTIONS:
+        where = build_where_filter(question)
+        retrieval[question] = _latency(lambda: retrieve(question, n_results, where=where, property_id=property_id), repeats)
+        results = retrieve(question, n_results, where=where, property_id=property_id)
+        documents, metadatas = results["documents"][0], results["metadatas"][0]
+        context[question] = _latency(
+            lambda: build_context(question, table, documents, metadatas, config["llm_model"], aggregates), repeats
+        )
+    for question in INTENT_QUESTIONS + RETRIEVAL_QUESTIONS:
+        extraction[question] = _latency(lambda: extract_relevant_context(table, question), repeats)
+        end_to_end[question] = _latency(lambda: answer_question(question, property_id, n_results, config["llm_model"]), repeats)
+
+    result.update(retrieval=retrieval, context=context, context_extraction=extraction, end_to_end=end_to_end)
+    result["retrieval_precision"] = retrieval_precision(df, file_name, property_id, n_results, seed)
+    return result
+
+def benchmark_alerts(days: int, competitors: int, seed: int, repeats: int) -> dict:
+    """
+    Times diffing a rate shop against the previous day's: the vectorized diff alone, and
+    recording the snapshot plus computing the alerts as every upload does.
+    """
+    from datetime import date, timedelta
+    from rate_store import build_rate_table
+    from snapshots import diff_snapshots, rate_alerts, record_snapshot
+
+    yesterday = build_rate_table(generate_comp_set(days, competitors, START_DATE, seed, missing_rate=0.02))
+    today = yesterday.copy()
+    rng = np.random.default_rng(seed)
+    comp_columns = [col for col in today.columns if col.startswith("Competitor ")]
+    rates = today[comp_columns].to_numpy(copy=True)
+    moved = rng.random(rates.shape) < 0.05
+    rates[moved] = np.round(rates[moved] * rng.choice([0.8, 1.15], moved.sum()))
+    today[comp_columns] = rates
+    today.loc[today.index[::30], "Min LOS"] += 1
+
+    property_id = f"bench-alerts-{days}x{competitors}"
+    record_snapshot(yesterday, "shop.csv", property_id, date.today() - timedelta(days=1))
+    return {
+        "days": days,
+        "competitors": competitors,
+        "alerts": len(diff_snapshots(today, yesterday)),
+        "diff": _latency(lambda: diff_snapshots(today, yesterday), repeats),
+        "record_and_diff": _latency(
+            lambda: (record_snapshot(today, "shop.csv", property_id), rate_alerts(property_id)), repeats
+        ),
+    }
+
+def run_benchmark(sizes: List[int], competitors: int = 5, seed: int = 42, repeats: int = 5, n_results: int = 5,
+                  missing_rate: float = 0.02, outlier_rate: float = 0.01, config_path: str = "config.yaml",
+                  keep_workspace: bool = False) -> dict:
+    """Runs the benchmark for each size in a temporary workspace and returns the report."""
+    config_path = os.path.abspath(config_path)
+    previous_cwd = os.getcwd()
+    workspace = prepare_workspace(tempfile.mkdtemp(prefix="revenue-benchmark-"), config_path)
+    try:
+        # App modules read config.yaml from the working directory when first imported
+        os.chdir(workspace)
+        install_stubs()
+        import chromadb
+
+        results = {}
+        for rows in sizes:
+            print(f"Benchmarking {rows} rows...", file=sys.stderr)
+            results[str(rows)] = benchmark_size(rows, competitors, seed, repeats, n_results, missing_rate, outlier_rate)
+        print("Benchmarking rate alerts...", file=sys.stderr)
+        alerts = benchmark_alerts(365, 20, seed, repeats)
+        print("Benchmarking start-up...", file=sys.stderr)
+        # Start-up is measured against the smallest dataset, whose stores are already on disk
+        startup = {
+            "cold": benchmark_startup(f"bench-{min(sizes)}", n_results, warm=False),
+            "warm": benchmark_startup(f"bench-{min(sizes)}", n_results, warm=True),
+        }
+    finally:
+        os.chdir(previous_cwd)
+        if not keep_workspace:
+            shutil.rmtree(workspace, ignore_errors=True)
+
+    return {
+        "version": REPORT_VERSION,
+        "parameters": {
+            "sizes": sizes,
+            "competitors": competitors,
+            "seed": seed,
+            "repeats": repeats,
+            "n_results": n_results,
+            "missing_rate": missing_rate,
+            "outlier_rate": outlier_rate,
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "chromadb": chromadb.__version__,
+        },
+        "results": results,
+        "alerts": alerts,
+        "startup": startup,
+    }
+
+def _timings(report: dict, prefix: str = "") -> Dict[str, float]:
+    """Flattens a report into {"path/to/metric": value} for every latency and duration."""
+    timings = {}
+    for key, value in report.items():
+        path = f"{prefix}/{key}" if prefix else key
+        if isinstance(value, dict):
+            timings.update(_timings(value, path))
+        elif isinstance(value, (int, float)) and (key.endswith("_ms") and key != "min_ms" or key.endswith("seconds")):
+            timings[path] = value
+    return timings
+
+def compare_reports(baseline: dict, report: dict, tolerance: float = 0.2) -> List[str]:
+    """Lists the timings that got slower than the baseline by more than `tolerance` (a fraction)."""
+    before = _timings({key: baseline.get(key, {}) for key in ("results", "alerts", "startup")})
+    after = _timings({key: report.get(key, {}) for key in ("results", "alerts", "startup")})
+    regressions = []
+    for path, value in sorted(after.items()):
+        previous = before.get(path)
+        if previous and value > previous * (1 + tolerance):
+            regressions.append(f"{path}: {previous} -> {value} (+{(value / previous - 1) * 100:.0f}%)")
+    return regressions
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Offline benchmark of the ingest and question pipeline.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Dataset sizes in rows")
+    parser.add_argument("--competitors", type=int, default=5, help="Competitors per comp set")
+    parser.add_argument("--seed", type=int, default=42, help="Seed of the synthetic data")
+    parser.add_argument("--repeats", type=int, default=5, help="Repetitions per latency measurement")
+    parser.add_argument("--n-results", type=int, default=5, help="Records retrieved per question")
+    parser.add_argument("--output", default="benchmark.json", help="JSON report to write")
+    parser.add_argument("--baseline", help="Previous report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown vs. the baseline (fraction)")
+    parser.add_argument("--keep-workspace", action="store_true", help="Keep the temporary stores for inspection")
+    args = parser.parse_args(argv)
+
+    # The pipeline logs every request at INFO level; keep the benchmark output readable
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(levelname)s - %(message)s")
+    report = run_benchmark(args.sizes, args.competitors, args.seed, args.repeats, args.n_results,
+                           keep_workspace=args.keep_workspace)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(f"Benchmark report written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            regressions = compare_reports(json.load(f), report, args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,148 @@
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, List, Optional
+
+from settings import config
+
+CACHE_PATH = config.get("cache_path", "./cache.sqlite3")
+
+class TTLLRUCache:
+    """
+    Two-tier cache: an in-memory LRU with per-entry TTL, backed by an optional SQLite
+    table so entries survive restarts. Values must be JSON-serializable.
+    """
+
+    def __init__(self, namespace: str, max_entries: int = 1024, ttl_seconds: float = 3600,
+                 disk_path: Optional[str] = None, max_disk_entries: int = 10000):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_disk_entries = max_disk_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk: Optional[sqlite3.Connection] = None
+        self._writes_since_prune = 0
+        if disk_path:
+            try:
+                directory = os.path.dirname(os.path.abspath(disk_path))
+                os.makedirs(directory, exist_ok=True)
+                self._disk = sqlite3.connect(disk_path, check_same_thread=False)
+                self._disk.execute(
+                    "CREATE TABLE IF NOT EXISTS cache ("
+                    "namespace TEXT, key TEXT, value TEXT, expires_at REAL, "
+                    "PRIMARY KEY (namespace, key))"
+                )
+                self._disk.commit()
+            except sqlite3.Error as e:
+                logging.error(f"Disk cache '{disk_path}' unavailable, using memory only: {e}")
+                self._disk = None
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        """Builds a fixed-length cache key from arbitrary parts."""
+        return hashlib.sha256(json.dumps(parts, default=str).encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    return value
+                del self._entries[key]
+            if self._disk is None:
+                return None
+            row = self._disk.execute(
+                "SELECT value, expires_at FROM cache WHERE namespace = ? AND key = ?",
+                (self.namespace, key),
+            ).fetchone()
+            if row is None or row[1] <= now:
+                return None
+            value = json.loads(row[0])
+            self._remember(key, row[1], value)
+            return value
+
+    def set(self, key: str, value: Any):
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._remember(key, expires_at, value)
+            if self._disk is None:
+                return
+            self._disk.execute(
+                "INSERT OR REPLACE INTO cache (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (self.namespace, key, json.dumps(value), expires_at),
+            )
+            self._writes_since_prune += 1
+            if self._writes_since_prune >= 100:
+                self._prune_disk()
+            self._disk.commit()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._disk is not None:
+                self._disk.execute("DELETE FROM cache WHERE namespace = ?", (self.namespace,))
+                self._disk.commit()
+
+    def _remember(self, key: str, expires_at: float, value: Any):
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _prune_disk(self):
+        self._writes_since_prune = 0
+        self._disk.execute("DELETE FROM cache WHERE namespace = ? AND expires_at <= ?", (self.namespace, time.time()))
+        self._disk.execute(
+            "DELETE FROM cache WHERE namespace = ? AND key NOT IN ("
+            "SELECT key FROM cache WHERE namespace = ? ORDER BY expires_at DESC LIMIT ?)",
+            (self.namespace, self.namespace, self.max_disk_entries),
+        )
+
+embedding_cache = TTLLRUCache(
+    "query_embeddings",
+    max_entries=config.get("embedding_cache_size", 2048),
+    ttl_seconds=config.get("embedding_cache_ttl", 7 * 24 * 3600),
+    disk_path=CACHE_PATH,
+)
+
+answer_cache = TTLLRUCache(
+    "answers",
+    max_entries=config.get("answer_cache_size", 512),
+    ttl_seconds=config.get("answer_cache_ttl", 24 * 3600),
+    disk_path=CACHE_PATH,
+)
+
+def normalize_question(question: str) -> str:
+    """Normalizes case, whitespace and trailing punctuation so equivalent questions share a key."""
+    return re.sub(r"\s+", " ", question.strip().lower()).rstrip("?!. ")
+
+def get_cached_query_embedding(text: str, model: str) -> Optional[List[float]]:
+    return embedding_cache.get(TTLLRUCache.make_key(model, text))
+
+def cache_query_embedding(text: str, model: str, embedding: List[float]):
+    embedding_cache.set(TTLLRUCache.make_key(model, text), [float(x) for x in embedding])
+
+def _answer_key(question: str, n_results: int, dataset_version: str, model: str, language: str) -> str:
+    return TTLLRUCache.make_key(normalize_question(question), n_results, dataset_version, model, language)
+
+def get_cached_answer(question: str, n_results: int, dataset_version: str, model: str, language: str = "en") -> Optional[dict]:
+    """Returns the cached {'response', 'confidence'} for a question against this dataset version."""
+    return answer_cache.get(_answer_key(question, n_results, dataset_version, model, language))
+
+def cache_answer(question: str, n_results: int, dataset_version: str, model: str, answer: dict, language: str = "en"):
+    answer_cache.set(_answer_key(question, n_results, dataset_version, model, language), answer)
+
+def invalidate_answers():
+    """Drops every cached answer; called whenever rate data is re-ingested or deleted."""
+    answer_cache.clear()
+    logging.info("Answer cache invalidated.")
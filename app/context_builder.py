@@ -0,0 +1,137 @@
+import json
+import logging
+from dataclasses import dataclass, asdict
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+import rate_store
+from question_filters import filter_table_by_question
+from settings import config
+
+DEFAULT_TOKEN_BUDGET = config.get("context_token_budget", 2000)
+# Rows serialized at a time while packing; packing stops once the budget is full
+SERIALIZE_CHUNK_ROWS = 256
+# Rows serialized to estimate the token count of sending a whole table
+BASELINE_SAMPLE_ROWS = 1000
+
+@dataclass
+class ContextReport:
+    """How much of the data went into the prompt, in estimated tokens."""
+    token_budget: int
+    baseline_tokens: int
+    context_tokens: int
+    rows_available: int
+    rows_included: int
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(0, self.baseline_tokens - self.context_tokens)
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (about four characters per token for CSV-like text)."""
+    return (len(text) + 3) // 4
+
+def get_token_budget(model: str) -> int:
+    """Returns the context token budget for a model from `context_token_budgets` in config.yaml."""
+    return config.get("context_token_budgets", {}).get(model, DEFAULT_TOKEN_BUDGET)
+
+def _pack_lines(header: str, lines: Iterable[str], budget: int) -> List[str]:
+    """
+    Returns the leading lines that fit into the budget after the header, in priority order.
+    Lines are consumed lazily, so a generator is only advanced until the budget is full.
+    """
+    used = estimate_tokens(header) + 1
+    included = []
+    for line in lines:
+        cost = estimate_tokens(line) + 1
+        if used + cost > budget:
+            break
+        used += cost
+        included.append(line)
+    return included
+
+def _estimate_table_tokens(table: pd.DataFrame) -> int:
+    """Estimated tokens of the whole table as CSV, from an even sample of its rows."""
+    if len(table) <= BASELINE_SAMPLE_ROWS:
+        return estimate_tokens(rate_store.to_frame(table).to_csv(index=False))
+    sample = table.iloc[np.linspace(0, len(table) - 1, BASELINE_SAMPLE_ROWS).astype(int)]
+    header, _, body = rate_store.to_frame(sample).to_csv(index=False).partition("\n")
+    return estimate_tokens(header) + 1 + round(len(body) / len(sample) * len(table) / 4)
+
+def _names_competitor(table: pd.DataFrame, question: str) -> bool:
+    question_lower = question.lower()
+    return any(col.lower().replace(" rate", "") in question_lower for col in rate_store.competitor_columns(table))
+
+def _iter_row_lines(table: pd.DataFrame, order: np.ndarray) -> Iterator[str]:
+    # Serializes rows in the given order a chunk at a time, so only the packed rows are formatted
+    for start in range(0, len(order), SERIALIZE_CHUNK_ROWS):
+        chunk = rate_store.to_frame(table.iloc[order[start:start + SERIALIZE_CHUNK_ROWS]].round(2))
+        yield from chunk.to_csv(index=False, header=False, float_format="%g").splitlines()
+
+def _context_from_table(table: pd.DataFrame, question: str, priority_dates: Sequence[str], budget: int) -> Tuple[str, int, int]:
+    candidates = filter_table_by_question(table, question)
+    if candidates.empty:
+        candidates = table
+
+    # Retrieved dates first (in retrieval order), then the remaining dates chronologically
+    priority = pd.DatetimeIndex(pd.to_datetime(list(dict.fromkeys(priority_dates)), errors="coerce")).dropna().unique()
+    rank = priority.get_indexer(candidates.index)
+    order = np.where(rank >= 0, rank, len(priority)).argsort(kind="stable")
+
+    header = ",".join(rate_store.to_frame(candidates.iloc[:0]).columns)
+    included = _pack_lines(header, _iter_row_lines(candidates, order), budget)
+    # Lines start with their ISO date; present the packed rows chronologically
+    body = "".join(f"{line}\n" for line in sorted(included, key=lambda line: line[:10]))
+    return f"{header}\n{body}", len(candidates), len(included)
+
+def _context_from_documents(documents: Sequence[str], budget: int) -> Tuple[str, int, int]:
+    # Each chunk repeats the CSV header and overlapping chunks repeat rows: keep each line once
+    lines = list(dict.fromkeys(line for doc in documents for line in doc.splitlines() if line.strip()))
+    if not lines:
+        return "", 0, 0
+    header, rows = lines[0], [line for line in lines[1:] if line != lines[0]]
+    included = _pack_lines(header, rows, budget)
+    return "\n".join([header] + included), len(rows), len(included)
+
+def build_context(
+    question: str,
+    table: Optional[pd.DataFrame],
+    documents: Sequence[str] = (),
+    metadatas: Sequence[dict] = (),
+    model: Optional[str] = None,
+    aggregates: Optional[pd.DataFrame] = None,
+) -> Tuple[str, ContextReport]:
+    """
+    Builds a compact CSV context for the LLM within the model's token budget.
+
+    Rows are restricted to the dates named in the question, prioritized by retrieval
+    relevance, deduplicated and serialized with a single header line. When materialized
+    aggregates are given and the question doesn't name a competitor, the compact aggregate
+    columns are sent instead of every competitor's rate. Falls back to the retrieved chunks
+    when no rate table is available.
+    """
+    budget = get_token_budget(model or config["llm_model"])
+    if table is not None and not table.empty:
+        priority_dates = [m["date"] for m in metadatas if m and "date" in m]
+        if aggregates is not None and not _names_competitor(table, question):
+            source = aggregates[[col for col in aggregates.columns if "Avg" not in col]]
+        else:
+            source = rate_store.with_average(table)
+        context, rows_available, rows_included = _context_from_table(source, question, priority_dates, budget)
+        # Before budgeting, the whole dataset was sent on this path
+        baseline_tokens = _estimate_table_tokens(table)
+    else:
+        context, rows_available, rows_included = _context_from_documents(documents, budget)
+        baseline_tokens = estimate_tokens(" ".join(documents))
+
+    report = ContextReport(
+        token_budget=budget,
+        baseline_tokens=baseline_tokens,
+        context_tokens=estimate_tokens(context),
+        rows_available=rows_available,
+        rows_included=rows_included,
+    )
+    logging.info("Context budget: " + json.dumps({**asdict(report), "tokens_saved": report.tokens_saved}))
+    return context, report
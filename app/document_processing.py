@@ -1,57 +1,146 @@
 import os
 import logging
-import hashlib
-from typing import List
+from typing import TYPE_CHECKING, Dict, Iterator, List, Set
 import pandas as pd
-from langchain.schema import Document
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 import streamlit as st
 
-# Cache for processed files
-processed_files_cache = set()
+from manifest import (
+    DEFAULT_PROPERTY,
+    compute_row_hash,
+    document_id,
+    get_document_entry,
+    load_row_hashes,
+    update_document_entry,
+)
+from rate_store import (
+    INGEST_BATCH_ROWS,
+    OWN_RATE_COLUMN,
+    RateTableWriter,
+    build_rate_table,
+    competitor_columns,
+    iter_comp_set_batches,
+)
+from telemetry import span, timed_iter
 
-def is_document_already_processed(file_name: str) -> bool:
+if TYPE_CHECKING:
+    from langchain.schema import Document
+
+def is_document_already_processed(file_name: str, content_hash: str, property_id: str = DEFAULT_PROPERTY) -> bool:
+    """
+    Checks if a document with exactly this content has already been processed,
+    using the persistent ingest manifest.
+    """
+    entry = get_document_entry(file_name, property_id)
+    return entry is not None and entry.get("content_hash") == content_hash
+
+def mark_document_as_processed(file_name: str, content_hash: str, row_hashes: Dict[str, str],
+                               property_id: str = DEFAULT_PROPERTY):
+    """
+    Records the document's content hash and per-row hashes ({date: row_hash}) in the ingest manifest.
+    """
+    update_document_entry(file_name, content_hash, row_hashes, property_id)
+
+def get_previous_row_hashes(file_name: str, property_id: str = DEFAULT_PROPERTY) -> Dict[str, str]:
+    """Returns the per-row hashes recorded for the last ingest of a document."""
+    return load_row_hashes(file_name, property_id)
+
+def changed_rows(docs: List["Document"], previous_rows: Dict[str, str]) -> List["Document"]:
+    """Returns the row documents that are new or whose hash changed since the last ingest."""
+    return [doc for doc in docs if previous_rows.get(doc.metadata["date"]) != doc.metadata["row_hash"]]
+
+def removed_row_ids(file_name: str, previous_rows: Dict[str, str], current_dates: Set[str]) -> List[str]:
+    """Returns the vector IDs of rows that no longer exist in the document."""
+    return [document_id(file_name, date) for date in previous_rows if date not in current_dates]
+
+def build_row_metadata(rate_table: pd.DataFrame) -> Dict[str, dict]:
     """
-    Checks if a document has already been processed by checking its hash in a cache.
+    Computes per-date structured metadata (calendar fields, comp set min/max/avg, own-rate
+    delta, Min LOS) used to pre-filter vector searches with Chroma `where` clauses.
     """
-    file_hash = hashlib.md5(file_name.encode()).hexdigest()
-    return file_hash in processed_files_cache
+    comp_rates = rate_table[competitor_columns(rate_table)]
+    fields = pd.DataFrame({
+        "date_ordinal": rate_table.index.strftime("%Y%m%d").astype(int),
+        "weekday": rate_table.index.weekday,
+        "month": rate_table.index.month,
+        "comp_min": comp_rates.min(axis=1).round(2),
+        "comp_max": comp_rates.max(axis=1).round(2),
+        "comp_avg": comp_rates.mean(axis=1).round(2),
+        "rate_delta": (rate_table[OWN_RATE_COLUMN] - comp_rates.mean(axis=1)).round(2),
+        "min_los": rate_table["Min LOS"],
+    }, index=rate_table.index.strftime("%Y-%m-%d"))
+    metadata = {}
+    for date, record in zip(fields.index, fields.to_dict("records")):
+        # Chroma metadata values must be scalars; drop missing values
+        metadata[date] = {
+            key: (int(value) if key in ("date_ordinal", "weekday", "month") else float(value))
+            for key, value in record.items() if pd.notna(value)
+        }
+    return metadata
+
+def _format_value(value) -> str:
+    # Column dtypes are inferred per batch (94 in one batch is 94.0 in another once a gap
+    # appears), so each value is formatted on its own to keep row text and hashes stable
+    if pd.isna(value):
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+def _batch_to_documents(df: pd.DataFrame, rate_table: pd.DataFrame, file_name: str, property_id: str) -> List["Document"]:
+    from langchain.schema import Document
+
+    row_metadata = build_row_metadata(rate_table)
+
+    # Convert the batch to row-aligned text chunks, each carrying the header and date metadata
+    lines = df.astype(object).map(_format_value).to_csv(index=False).splitlines()
+    header, rows = lines[0], lines[1:]
+    docs_by_date: Dict[str, "Document"] = {}
+    for timestamp, row in zip(pd.to_datetime(df["Date"], errors="coerce"), rows):
+        if pd.isna(timestamp):
+            logging.warning(f"Skipping row with invalid date in file '{file_name}': {row}")
+            continue
+        date = timestamp.strftime("%Y-%m-%d")
+        docs_by_date[date] = Document(
+            page_content=f"{header}\n{row}",
+            metadata={
+                "file_name": file_name,
+                "property_id": property_id,
+                "date": date,
+                # The header is hashed too, so renamed columns re-embed the rows under the new header
+                "row_hash": compute_row_hash(f"{header}\n{row}"),
+                **row_metadata.get(date, {}),
+            },
+        )
+    return list(docs_by_date.values())
 
-def mark_document_as_processed(file_name: str):
+def iter_document_batches(file, property_id: str = DEFAULT_PROPERTY,
+                          batch_size: int = INGEST_BATCH_ROWS) -> Iterator[List["Document"]]:
     """
-    Marks a document as processed by adding its hash to the cache.
+    Streams a comp set file in bounded row batches, yielding the row documents of each batch.
+    The typed rate table is appended to Parquet batch by batch and replaces the stored table
+    once the whole file has been read. Raises ValueError for unsupported or invalid files.
     """
-    file_hash = hashlib.md5(file_name.encode()).hexdigest()
-    processed_files_cache.add(file_hash)
+    with RateTableWriter(file.name, property_id) as writer:
+        for df in timed_iter("parse", iter_comp_set_batches(file, batch_size), lambda df: {"rows": len(df)}):
+            with span("rate_table.write", rows=len(df)):
+                rate_table = build_rate_table(df)
+                writer.write(rate_table)
+            with span("chunking", rows=len(df)) as counts:
+                docs = _batch_to_documents(df, rate_table, file.name, property_id)
+                counts["chunks"] = len(docs)
+            yield docs
 
-def process_document(file) -> List[Document]:
-    """Processes a comp set file, extracting data and splitting it into chunks."""
+def process_document(file, property_id: str = DEFAULT_PROPERTY) -> List["Document"]:
+    """Processes a comp set file, extracting data and splitting it into one chunk per date."""
     try:
-        # Load file as DataFrame
-        if file.name.endswith('.csv'):
-            df = pd.read_csv(file)
-        elif file.name.endswith('.xlsx'):
-            df = pd.read_excel(file)
-        else:
-            st.error("Unsupported file type. Please upload a CSV or Excel file.")
-            return []
-
-        # Validate required columns
-        required_columns = ["Date", "Your Rate", "Competitor Rates", "Min LOS", "Advance Purchase"]
-        missing_columns = [col for col in required_columns if col not in df.columns]
-        if missing_columns:
-            st.error(f"Missing required columns: {', '.join(missing_columns)}")
-            return []
-
-        # Convert DataFrame to text chunks
-        text_data = df.to_csv(index=False)
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=400, chunk_overlap=100)
-        splits = text_splitter.split_text(text_data)
-
-        # Create Document objects
-        docs = [Document(page_content=chunk, metadata={"file_name": file.name}) for chunk in splits]
-        return docs
+        docs_by_date: Dict[str, "Document"] = {}
+        for docs in iter_document_batches(file, property_id):
+            docs_by_date.update((doc.metadata["date"], doc) for doc in docs)
+        return list(docs_by_date.values())
+    except ValueError as e:
+        st.error(str(e))
+        return []
     except Exception as e:
         logging.error(f"Error processing document: {e}")
         st.error(f"Error processing document: {e}")
-        return []
\ No newline at end of file
+        return []
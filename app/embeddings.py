@@ -0,0 +1,139 @@
+import time
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
+
+def ollama_base_url(url: str) -> str:
+    """
+    Returns the Ollama server's base URL for a configured `ollama_url`, which may be the base
+    URL itself ("http://localhost:11434") or an endpoint under it (".../api/embeddings"),
+    as Chroma's Ollama embedding function accepts both.
+    """
+    parsed = urlparse(url)
+    if parsed.path.rstrip("/").startswith("/api/"):
+        return f"{parsed.scheme}://{parsed.netloc}"
+    return url.rstrip("/")
+
+class PooledOllamaEmbeddingFunction(EmbeddingFunction[Documents]):
+    """
+    Ollama embedding function that reuses one HTTP session with a connection pool,
+    so repeated questions don't pay for a new TCP connection on every embedding.
+    Each call embeds its whole batch of texts in one `/api/embed` request.
+    """
+
+    def __init__(self, url: str, model_name: str, pool_size: int = 10, timeout: float = 60.0,
+                 keep_alive: Optional[Union[str, int]] = None):
+        self.url = url
+        self._endpoint = f"{ollama_base_url(url)}/api/embed"
+        self.model_name = model_name
+        self.pool_size = pool_size
+        self.timeout = timeout
+        # How long Ollama keeps the model loaded after a request ("30m", -1 forever); None uses its default
+        self.keep_alive = keep_alive
+        self._session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            # urllib3 only retries idempotent methods by default; embedding requests are POSTs
+            max_retries=Retry(
+                total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504], allowed_methods=frozenset({"POST"})
+            ),
+        )
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+    def __call__(self, input: Documents) -> Embeddings:
+        payload = {"model": self.model_name, "input": list(input)}
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        response = self._session.post(self._endpoint, json=payload, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()["embeddings"]
+
+    def close(self):
+        """Closes the pooled HTTP connections."""
+        self._session.close()
+
+    @staticmethod
+    def name() -> str:
+        # Same name as Chroma's built-in Ollama function so existing collections stay compatible
+        return "ollama"
+
+    def get_config(self) -> Dict[str, Any]:
+        return {"url": self.url, "model_name": self.model_name, "timeout": self.timeout}
+
+    @staticmethod
+    def build_from_config(config: Dict[str, Any]) -> "PooledOllamaEmbeddingFunction":
+        return PooledOllamaEmbeddingFunction(
+            url=config["url"],
+            model_name=config["model_name"],
+            timeout=config.get("timeout", 60.0),
+        )
+
+def _embed_batch_with_retry(
+    embedding_function: Callable[[Documents], Embeddings],
+    texts: List[str],
+    max_retries: int,
+    retry_backoff: float,
+) -> Embeddings:
+    for attempt in range(max_retries + 1):
+        try:
+            return embedding_function(texts)
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            delay = retry_backoff * (2 ** attempt)
+            logging.warning(f"Embedding batch failed (attempt {attempt + 1}/{max_retries + 1}), retrying in {delay:.1f}s: {e}")
+            time.sleep(delay)
+
+def iter_embedded_batches(
+    embedding_function: Callable[[Documents], Embeddings],
+    texts: List[str],
+    batch_size: int = 32,
+    concurrency: int = 4,
+    max_retries: int = 3,
+    retry_backoff: float = 1.0,
+) -> Iterator[Tuple[int, int, Embeddings]]:
+    """
+    Embeds texts in batches with at most `concurrency` batches in flight against the
+    embedding endpoint, yielding (start, end, embeddings) in input order.
+
+    Only `2 * concurrency` batches are ever queued ahead of the consumer, so a slow
+    consumer (e.g. the vector store upsert) applies backpressure to the embedding calls.
+    Failed batches are retried with exponential backoff before the error is raised.
+    """
+    batch_size = max(1, batch_size)
+    concurrency = max(1, concurrency)
+    bounds = iter([(start, min(start + batch_size, len(texts))) for start in range(0, len(texts), batch_size)])
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="embed") as executor:
+        pending = deque()
+
+        def submit_next() -> bool:
+            bound = next(bounds, None)
+            if bound is None:
+                return False
+            start, end = bound
+            future = executor.submit(_embed_batch_with_retry, embedding_function, texts[start:end], max_retries, retry_backoff)
+            pending.append((start, end, future))
+            return True
+
+        for _ in range(2 * concurrency):
+            if not submit_next():
+                break
+        while pending:
+            start, end, future = pending.popleft()
+            try:
+                embeddings = future.result()
+            except Exception:
+                for _, _, queued in pending:
+                    queued.cancel()
+                raise
+            submit_next()
+            yield start, end, embeddings
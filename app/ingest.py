@@ -0,0 +1,117 @@
+import logging
+from typing import Callable, Dict, Optional, Set
+
+import streamlit as st
+
+from aggregates import materialize_aggregates
+from cache import invalidate_answers
+from document_processing import (
+    is_document_already_processed,
+    mark_document_as_processed,
+    iter_document_batches,
+    get_previous_row_hashes,
+    changed_rows,
+    removed_row_ids,
+)
+from manifest import DEFAULT_PROPERTY, compute_file_hash
+from snapshots import has_snapshot, record_rate_shop
+from telemetry import span
+from vector_store import add_to_vector_collection, delete_file_vectors, delete_from_vector_collection
+
+def _record_rate_shop(file_name: str, property_id: str) -> Optional[int]:
+    # Keep the shop as a dated snapshot and diff it against the file's previous day's shop;
+    # a failure here never fails the ingest. Returns the number of alerts, or None.
+    try:
+        with span("snapshot.diff") as counts:
+            alerts = record_rate_shop(file_name, property_id)
+            counts["alerts"] = 0 if alerts is None else len(alerts)
+    except Exception as e:
+        logging.error(f"Rate shop snapshot of '{file_name}' failed: {e}")
+        return None
+    return None if alerts is None else len(alerts)
+
+def ingest_document(
+    file,
+    property_id: str = DEFAULT_PROPERTY,
+    progress_callback: Optional[Callable[[int, Optional[int]], None]] = None,
+) -> Optional[dict]:
+    """
+    Ingests a comp set file incrementally: only rows whose hash changed since the last
+    upload are embedded and upserted, and rows that disappeared are deleted.
+    Everything is stored in the property's own namespace.
+
+    The file is streamed in bounded row batches; each batch is parsed, chunked and embedded
+    before the next one is read, so peak memory does not grow with the file size.
+    `progress_callback(rows_done, total)` reports progress (total is None while streaming).
+
+    Every ingested file is also kept as a dated rate shop snapshot and diffed against the
+    file's shop of the previous day (see snapshots.py); an unchanged re-upload still records
+    the day's shop once.
+
+    Returns counts of added/updated, removed and unchanged rows and of rate alerts,
+    {"skipped": True} if the exact same content was already ingested, or None if processing failed.
+    """
+    with span("hash"):
+        content_hash = compute_file_hash(file)
+    if is_document_already_processed(file.name, content_hash, property_id):
+        # Unchanged rates are still today's shop; without it tomorrow would diff against an older day
+        if not has_snapshot(file.name, property_id):
+            _record_rate_shop(file.name, property_id)
+        return {"skipped": True}
+
+    previous_rows = get_previous_row_hashes(file.name, property_id)
+    # Without row hashes the stored vectors of this file (e.g. chunks from before row-level IDs,
+    # or a failed first ingest) can't be diffed; replace them all
+    if not previous_rows and not delete_file_vectors(file.name, property_id):
+        return None
+    row_hashes: Dict[str, str] = {}
+    changed_dates: Set[str] = set()
+    try:
+        for docs in iter_document_batches(file, property_id):
+            changed_docs = changed_rows(docs, previous_rows)
+            if changed_docs:
+                done_before = len(row_hashes)
+                batch_progress = (
+                    (lambda done, _total: progress_callback(done_before + done, None)) if progress_callback else None
+                )
+                if not add_to_vector_collection(changed_docs, file.name, property_id, batch_progress):
+                    # Leave the manifest untouched so the next upload retries the same rows
+                    return None
+            changed_dates.update(doc.metadata["date"] for doc in changed_docs)
+            row_hashes.update((doc.metadata["date"], doc.metadata["row_hash"]) for doc in docs)
+            if progress_callback:
+                progress_callback(len(row_hashes), None)
+    except ValueError as e:
+        st.error(str(e))
+        return None
+    except Exception as e:
+        logging.error(f"Error processing document: {e}")
+        st.error(f"Error processing document: {e}")
+        return None
+
+    if not row_hashes:
+        return None
+
+    changed = len(changed_dates)
+    removed_dates = set(previous_rows) - set(row_hashes)
+    removed_ids = removed_row_ids(file.name, previous_rows, set(row_hashes))
+    logging.info(
+        f"Incremental ingest of '{file.name}' for property '{property_id}': {changed} changed, "
+        f"{len(removed_ids)} removed, {len(row_hashes) - changed} unchanged rows."
+    )
+    if not delete_from_vector_collection(removed_ids, file.name, property_id):
+        # Keep the old row hashes so the next upload removes the stale rows again
+        return None
+    mark_document_as_processed(file.name, content_hash, row_hashes, property_id)
+    # Refresh only the aggregate rows whose dates (or rolling windows) changed
+    with span("aggregates.refresh", rows=len(changed_dates | removed_dates)):
+        materialize_aggregates(file.name, property_id, (changed_dates | removed_dates) if previous_rows else None)
+    invalidate_answers()
+    alerts = _record_rate_shop(file.name, property_id)
+    return {
+        "skipped": False,
+        "changed": changed,
+        "removed": len(removed_ids),
+        "unchanged": len(row_hashes) - changed,
+        "alerts": alerts or 0,
+    }
@@ -0,0 +1,129 @@
+import re
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+import pandas as pd
+
+import rate_store
+from aggregates import COMP_SET_SIZE, OWN_RANK, RATE_GAP, RATE_GAP_PCT, compute_aggregates
+from question_filters import filter_table_by_question
+
+@dataclass
+class IntentResult:
+    """Exact answer to an analytic question, ready for the table view."""
+    intent: str
+    frame: pd.DataFrame
+    summary: str
+
+@dataclass
+class _Intent:
+    name: str
+    matcher: Callable[[str], bool]
+    handler: Callable[[pd.DataFrame, str], IntentResult]
+    source: str
+
+_INTENTS: List[_Intent] = []
+
+def _keyword_matcher(*patterns: str) -> Callable[[str], bool]:
+    compiled = [re.compile(pattern) for pattern in patterns]
+    return lambda question: any(pattern.search(question) for pattern in compiled)
+
+def register_intent(name: str, *patterns: str, matcher: Optional[Callable[[str], bool]] = None,
+                    source: str = "rates"):
+    """
+    Registers an intent handler. The handler receives the rate table, or the materialized
+    aggregate table if `source` is "aggregates" (already filtered to the dates named in the
+    question), and the question. Intents are tried in registration order; the matcher
+    receives the lower-cased question.
+    """
+    def decorator(handler: Callable[[pd.DataFrame, str], IntentResult]):
+        _INTENTS.append(_Intent(name, matcher or _keyword_matcher(*patterns), handler, source))
+        return handler
+    return decorator
+
+def route_question(question: str, table: Optional[pd.DataFrame],
+                   aggregates: Optional[pd.DataFrame] = None) -> Optional[IntentResult]:
+    """
+    Answers the question deterministically if an intent matches, otherwise returns None.
+    Aggregate-based intents use the materialized aggregates when given and compute them
+    from the rate table otherwise.
+    """
+    if table is None or table.empty:
+        return None
+    question_lower = question.lower()
+    for intent in _INTENTS:
+        if intent.matcher(question_lower):
+            if intent.source == "aggregates":
+                source = aggregates if aggregates is not None else compute_aggregates(table)
+            else:
+                source = table
+            return intent.handler(filter_table_by_question(source, question), question)
+    return None
+
+@register_intent("rate_gap", r"\bgap\b", r"\bdifference\b", r"\bspread\b", source="aggregates")
+def _rate_gap(aggregates: pd.DataFrame, question: str) -> IntentResult:
+    columns = [rate_store.OWN_RATE_COLUMN, rate_store.AVERAGE_COLUMN, RATE_GAP, RATE_GAP_PCT]
+    summary = (
+        f"Average gap to the comp set over {len(aggregates)} days: {aggregates[RATE_GAP].mean():+.2f} "
+        f"({aggregates[RATE_GAP_PCT].mean():+.1f}%)." if len(aggregates) else "No dates match the question."
+    )
+    return IntentResult("rate_gap", rate_store.to_frame(aggregates[columns]), summary)
+
+@register_intent("competitor_rank", r"\brank", r"\bposition\b", source="aggregates")
+def _competitor_rank(aggregates: pd.DataFrame, question: str) -> IntentResult:
+    ranked = aggregates[[rate_store.OWN_RATE_COLUMN, OWN_RANK, COMP_SET_SIZE]]
+    summary = (
+        f"Average rank {ranked[OWN_RANK].mean():.1f} of {ranked[COMP_SET_SIZE].max() + 1:.0f} "
+        f"(1 = cheapest) over {len(ranked)} days."
+        if len(ranked) else "No dates match the question."
+    )
+    return IntentResult("competitor_rank", rate_store.to_frame(ranked), summary)
+
+@register_intent("restrictions", r"min(?:imum)? los", r"length of stay", r"advance purchase", r"restriction")
+def _restrictions(table: pd.DataFrame, question: str) -> IntentResult:
+    question_lower = question.lower()
+    if "advance purchase" in question_lower:
+        column = "Advance Purchase"
+    elif "los" in question_lower or "length of stay" in question_lower:
+        column = "Min LOS"
+    else:
+        column = None
+    restricted = rate_store.restricted_days(table, column)
+    label = column or "restrictions"
+    return IntentResult("restrictions", rate_store.to_frame(restricted), f"{len(restricted)} days with {label}.")
+
+@register_intent("highest_competitor_rate", matcher=lambda q: "competitor" in q and re.search(r"\b(highest|max(imum)?|most expensive)\b", q) is not None)
+def _highest_competitor_rate(table: pd.DataFrame, question: str) -> IntentResult:
+    extremes = rate_store.competitor_rate_extremes(table, highest=True)
+    if extremes.empty:
+        return IntentResult("highest_competitor_rate", rate_store.to_frame(extremes), "No competitor rates found.")
+    top = extremes.iloc[0]
+    summary = f"Highest competitor rate: {top['Competitor Rate']:.2f} ({top['Competitor']}) on {extremes.index[0]:%Y-%m-%d}."
+    return IntentResult("highest_competitor_rate", rate_store.to_frame(extremes.head(10)), summary)
+
+@register_intent("lowest_competitor_rate", matcher=lambda q: "competitor" in q and re.search(r"\b(lowest|min(imum)?|cheapest)\b", q) is not None)
+def _lowest_competitor_rate(table: pd.DataFrame, question: str) -> IntentResult:
+    extremes = rate_store.competitor_rate_extremes(table, highest=False)
+    if extremes.empty:
+        return IntentResult("lowest_competitor_rate", rate_store.to_frame(extremes), "No competitor rates found.")
+    top = extremes.iloc[0]
+    summary = f"Lowest competitor rate: {top['Competitor Rate']:.2f} ({top['Competitor']}) on {extremes.index[0]:%Y-%m-%d}."
+    return IntentResult("lowest_competitor_rate", rate_store.to_frame(extremes.head(10)), summary)
+
+@register_intent("overpriced", r"overpriced", r"over-priced", r"too expensive", r"above (?:the )?(?:comp|competitor)")
+def _overpriced(table: pd.DataFrame, question: str) -> IntentResult:
+    overpriced = rate_store.overpriced_days(table)
+    if overpriced.empty:
+        summary = "No days found where your rate is overpriced compared to competitors."
+    else:
+        summary = f"You are overpriced on {len(overpriced)} of {len(table)} days."
+    return IntentResult("overpriced", rate_store.to_frame(overpriced), summary)
+
+@register_intent("underpriced", r"underpriced", r"under-priced", r"too cheap", r"below (?:the )?(?:comp|competitor)")
+def _underpriced(table: pd.DataFrame, question: str) -> IntentResult:
+    underpriced = rate_store.underpriced_days(table)
+    if underpriced.empty:
+        summary = "No days found where your rate is underpriced compared to competitors."
+    else:
+        summary = f"You are underpriced on {len(underpriced)} of {len(table)} days."
+    return IntentResult("underpriced", rate_store.to_frame(underpriced), summary)
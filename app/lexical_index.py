@@ -0,0 +1,150 @@
+import os
+import re
+import json
+import logging
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from settings import config
+
+LEXICAL_INDEX_PATH = config.get("lexical_index_path", "./lexical_index.sqlite3")
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_ISO_DATE = re.compile(r"\b\d{4}-\d{2}-\d{2}\b")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    property_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    file_name TEXT,
+    date TEXT,
+    body TEXT,
+    document TEXT,
+    metadata TEXT,
+    PRIMARY KEY (property_id, id)
+);
+CREATE INDEX IF NOT EXISTS chunks_by_date ON chunks (property_id, date);
+CREATE INDEX IF NOT EXISTS chunks_by_file ON chunks (property_id, file_name);
+CREATE VIRTUAL TABLE IF NOT EXISTS chunk_terms USING fts5(body, content='chunks', content_rowid='rowid');
+CREATE TRIGGER IF NOT EXISTS chunks_insert AFTER INSERT ON chunks BEGIN
+    INSERT INTO chunk_terms (rowid, body) VALUES (new.rowid, new.body);
+END;
+CREATE TRIGGER IF NOT EXISTS chunks_delete AFTER DELETE ON chunks BEGIN
+    INSERT INTO chunk_terms (chunk_terms, rowid, body) VALUES ('delete', old.rowid, old.body);
+END;
+"""
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased alphanumeric tokens; "129.50" becomes ["129", "50"] like FTS5's tokenizer."""
+    return _TOKEN.findall(text.lower())
+
+def _row_text(document: str) -> str:
+    # The CSV header repeats in every chunk and would match every question; only the row is indexed
+    return document.split("\n", 1)[-1]
+
+def query_terms(question: str) -> List[str]:
+    """
+    The question tokens worth matching against row values: numbers, not words. ISO dates are
+    left to the date index; their year alone would match every row of that year.
+    """
+    tokens = tokenize(_ISO_DATE.sub(" ", question))
+    return list(dict.fromkeys(token for token in tokens if token.isdigit() and len(token) > 1))
+
+class LexicalIndex:
+    """
+    BM25 inverted index (SQLite FTS5) over the row text of every vector store chunk, with an
+    exact date index beside it. Embeddings are poor at matching numbers and dates; this finds
+    "the row of 2024-01-15" or "the day a competitor charged 129" exactly.
+    Chunks are stored with their document and metadata, so hits can be returned without Chroma.
+    """
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+        self._db.commit()
+
+    def upsert(self, property_id: str, ids: Sequence[str], documents: Sequence[str], metadatas: Sequence[dict]):
+        rows = [
+            (property_id, chunk_id, metadata.get("file_name"), metadata.get("date"),
+             _row_text(document), document, json.dumps(metadata))
+            for chunk_id, document, metadata in zip(ids, documents, metadatas)
+        ]
+        with self._lock:
+            # Delete first so the FTS delete trigger removes the old terms of updated rows
+            self._db.executemany("DELETE FROM chunks WHERE property_id = ? AND id = ?", [(property_id, i) for i in ids])
+            self._db.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            self._db.commit()
+
+    def delete(self, property_id: str, ids: Sequence[str]):
+        with self._lock:
+            self._db.executemany("DELETE FROM chunks WHERE property_id = ? AND id = ?", [(property_id, i) for i in ids])
+            self._db.commit()
+
+    def delete_file(self, property_id: str, file_name: str):
+        with self._lock:
+            self._db.execute("DELETE FROM chunks WHERE property_id = ? AND file_name = ?", (property_id, file_name))
+            self._db.commit()
+
+    def count(self, property_id: str) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM chunks WHERE property_id = ?", (property_id,)).fetchone()[0]
+
+    def search(self, property_id: str, question: str, limit: int) -> List[Tuple[str, float, float]]:
+        """
+        Ranks the property's chunks by BM25 against the numbers in the question.
+        Returns (id, bm25 score, share of query terms the row contains), best first.
+        """
+        terms = query_terms(question)
+        if not terms:
+            return []
+        match = " OR ".join(f'"{term}"' for term in terms)
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT chunks.id, -bm25(chunk_terms), chunks.body FROM chunk_terms "
+                "JOIN chunks ON chunks.rowid = chunk_terms.rowid "
+                "WHERE chunk_terms MATCH ? AND chunks.property_id = ? ORDER BY bm25(chunk_terms) LIMIT ?",
+                (match, property_id, limit),
+            ).fetchall()
+        return [(chunk_id, score, len(set(terms) & set(tokenize(body))) / len(terms)) for chunk_id, score, body in rows]
+
+    def dates(self, property_id: str, start: str, end: str, limit: int) -> List[str]:
+        """Returns the IDs of the property's chunks whose stay date lies in [start, end], in date order."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id FROM chunks WHERE property_id = ? AND date BETWEEN ? AND ? ORDER BY date LIMIT ?",
+                (property_id, start, end, limit),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def get(self, property_id: str, ids: Sequence[str]) -> Dict[str, Tuple[str, dict]]:
+        """Returns {id: (document, metadata)} for the given chunk IDs."""
+        found = {}
+        with self._lock:
+            # Stay well below SQLite's bound parameter limit
+            for start in range(0, len(ids), 500):
+                batch = list(ids[start:start + 500])
+                rows = self._db.execute(
+                    f"SELECT id, document, metadata FROM chunks WHERE property_id = ? AND id IN ({','.join('?' * len(batch))})",
+                    (property_id, *batch),
+                ).fetchall()
+                found.update((chunk_id, (document, json.loads(metadata))) for chunk_id, document, metadata in rows)
+        return found
+
+_index_lock = threading.Lock()
+_lexical_index: Optional[LexicalIndex] = None
+
+def get_lexical_index() -> Optional[LexicalIndex]:
+    """Returns the shared lexical index, or None if it cannot be opened (retrieval is then vector-only)."""
+    global _lexical_index
+    with _index_lock:
+        if _lexical_index is None:
+            try:
+                _lexical_index = LexicalIndex(LEXICAL_INDEX_PATH)
+            except sqlite3.Error as e:
+                logging.error(f"Lexical index '{LEXICAL_INDEX_PATH}' unavailable: {e}")
+                return None
+        return _lexical_index
@@ -1,16 +1,26 @@
+import json
+import time
+import asyncio
 import logging
-from typing import Generator
+from collections import deque
+from dataclasses import dataclass, asdict
+from typing import TYPE_CHECKING, AsyncGenerator, Deque, Generator, Iterable, List, Optional
 
-import ollama
 import streamlit as st
-import yaml
-from deep_translator import GoogleTranslator  # Use deep-translator
 
-def load_config():
-    with open('config.yaml', 'r') as f:
-        return yaml.safe_load(f)
+from settings import config
+from telemetry import record_span
+from translation import (
+    TranslationBackend,
+    atranslate_stream,
+    get_translation_backend,
+    translate_phrase,
+    translate_stream,
+)
 
-config = load_config()
+if TYPE_CHECKING:
+    # The Ollama client is imported on first use to keep app start-up fast
+    import ollama
 
 system_prompt = """
 You are an AI assistant for Revenue Management decisions for a hotel that provides detailed answers based solely on the given context.
@@ -32,70 +42,175 @@ Formatting Guidelines:
 Remember: Base your entire response solely on the information provided in the context.
 """
 
+@dataclass
+class StreamMetrics:
+    """Perceived-latency measurements of one streamed LLM response, in seconds."""
+    model: str
+    language: str
+    time_to_first_token: Optional[float] = None
+    time_to_last_token: Optional[float] = None
+    tokens: int = 0
+    prompt_tokens: Optional[int] = None
+
+    @property
+    def tokens_per_second(self) -> float:
+        if not self.time_to_first_token or not self.time_to_last_token or self.tokens < 2:
+            return 0.0
+        generation_time = self.time_to_last_token - self.time_to_first_token
+        return (self.tokens - 1) / generation_time if generation_time > 0 else 0.0
+
+# Shared async client of the service layer's event loop (see service.py)
+_async_client: Optional["ollama.AsyncClient"] = None
+
+# Most recent measurements, newest last
+recent_stream_metrics: Deque[StreamMetrics] = deque(maxlen=100)
+
+def _observe_token(metrics: StreamMetrics, started: float):
+    now = time.perf_counter() - started
+    if metrics.time_to_first_token is None:
+        metrics.time_to_first_token = now
+    metrics.time_to_last_token = now
+    metrics.tokens += 1
+
+def _record_stream(metrics: StreamMetrics, started: float):
+    # Prefill runs until the first token arrives; generation until the last one
+    if metrics.time_to_first_token is not None:
+        record_span("llm.prefill", metrics.time_to_first_token, started, prompt_tokens=metrics.prompt_tokens)
+        record_span(
+            "llm.generation",
+            metrics.time_to_last_token - metrics.time_to_first_token,
+            started + metrics.time_to_first_token,
+            output_tokens=metrics.tokens,
+        )
+    recent_stream_metrics.append(metrics)
+    logging.info("LLM stream metrics: " + json.dumps({**asdict(metrics), "tokens_per_second": round(metrics.tokens_per_second, 2)}))
+
+def measure_stream(chunks: Iterable[str], metrics: StreamMetrics) -> Generator[str, None, None]:
+    """Passes chunks through while recording time-to-first-token, time-to-last-token and tokens/sec."""
+    started = time.perf_counter()
+    try:
+        for chunk in chunks:
+            _observe_token(metrics, started)
+            yield chunk
+    finally:
+        _record_stream(metrics, started)
+
+# Prompt for the short narrative added to exact intent answers
+NARRATIVE_PROMPT = "In two or three sentences, summarize the answer to: {question}"
+
 def call_llm(context: str, prompt: str, language: str) -> Generator[str, None, None]:
-    """Calls the language model with context and prompt to generate a response, translating if necessary."""
+    """
+    Calls the language model with context and prompt and streams the response as it is
+    generated, translating if necessary. Streaming metrics are recorded for every call.
+    """
+    metrics = StreamMetrics(model=config['llm_model'], language=language)
+    yield from measure_stream(_generate(context, prompt, language, metrics), metrics)
+
+def _generate(context: str, prompt: str, language: str, metrics: StreamMetrics) -> Generator[str, None, None]:
     try:
-        # Debug: Log context and prompt
-        logging.info(f"Context passed to LLM:\n{context[:500]}")  # Log first 500 characters for brevity
-        logging.info(f"Prompt passed to LLM: {prompt}")
+        logging.info(f"Prompt passed to LLM: {prompt} ({len(context)} characters of context)")
+        logging.debug(f"Context passed to LLM:\n{context}")
         
         if not context.strip():
-            yield "The context is empty. Please provide valid data."
+            yield translate_text("The context is empty. Please provide valid data.", language)
             return
-        
-        # If the selected language is English, stream the response directly
-        if language == 'en':
-            response = ollama.chat(
-                model=config['llm_model'],
-                stream=True,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": system_prompt,
-                    },
-                    {
-                        "role": "user",
-                        "content": f"Context: {context}\nQuestion: {prompt}",
-                    },
-                ],
-            )
-            for chunk in response:
-                if chunk["done"] is False:
-                    yield chunk["message"]["content"]
-                else:
-                    break
+
+        import ollama
+
+        backend = get_translation_backend() if language != 'en' else None
+        response = ollama.chat(
+            model=config['llm_model'],
+            stream=True,
+            keep_alive=config.get("ollama_keep_alive"),
+            messages=_messages(context, prompt, language, backend),
+        )
+        tokens = _content_tokens(response, metrics)
+
+        # English and natively answered languages stream directly; other backends
+        # translate sentence by sentence as the stream arrives
+        if backend is None or not backend.translates_stream:
+            yield from tokens
         else:
-            # For other languages, collect the response and translate it
-            response = ollama.chat(
-                model=config['llm_model'],
-                stream=False,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": system_prompt,
-                    },
-                    {
-                        "role": "user",
-                        "content": f"Context: {context}\nQuestion: {prompt}",
-                    },
-                ],
-            )
-            full_response = response["message"]["content"]
-            translated_text = translate_text(full_response, language)
-            yield translated_text  # Yield the translated text
+            yield from translate_stream(tokens, language)
     except Exception as e:
         logging.error(f"An error occurred while generating the response: {e}")
         st.error(f"An error occurred while generating the response: {e}")
 
+def _messages(context: str, prompt: str, language: str, backend: Optional[TranslationBackend]) -> List[dict]:
+    return [
+        {
+            "role": "system",
+            "content": system_prompt + (backend.system_instruction(language) if backend else ""),
+        },
+        {
+            "role": "user",
+            "content": f"Context: {context}\nQuestion: {prompt}",
+        },
+    ]
+
+def _get_async_client() -> "ollama.AsyncClient":
+    global _async_client
+    if _async_client is None:
+        import ollama
+
+        _async_client = ollama.AsyncClient()
+    return _async_client
+
+async def acall_llm(context: str, prompt: str, language: str,
+                    client: Optional["ollama.AsyncClient"] = None) -> AsyncGenerator[str, None]:
+    """
+    Async `call_llm` for the service layer: streams the response without holding a thread
+    while the model generates. Errors are raised to the caller instead of shown in the UI.
+    Cancelling the consuming task closes the connection, which stops the generation.
+    """
+    metrics = StreamMetrics(model=config['llm_model'], language=language)
+    started = time.perf_counter()
+    try:
+        if not context.strip():
+            _observe_token(metrics, started)
+            yield await asyncio.to_thread(translate_text, "The context is empty. Please provide valid data.", language)
+            return
+
+        logging.info(f"Prompt passed to LLM: {prompt} ({len(context)} characters of context)")
+        backend = get_translation_backend() if language != 'en' else None
+        response = await (client or _get_async_client()).chat(
+            model=config['llm_model'],
+            stream=True,
+            messages=_messages(context, prompt, language, backend),
+            keep_alive=config.get("ollama_keep_alive"),
+        )
+
+        async def tokens() -> AsyncGenerator[str, None]:
+            async for chunk in response:
+                if chunk["done"] is False:
+                    yield chunk["message"]["content"]
+                else:
+                    metrics.prompt_tokens = chunk.get("prompt_eval_count")
+
+        chunks = tokens() if backend is None or not backend.translates_stream else atranslate_stream(tokens(), language)
+        async for chunk in chunks:
+            _observe_token(metrics, started)
+            yield chunk
+    finally:
+        _record_stream(metrics, started)
+
+def _content_tokens(response: Iterable[dict], metrics: StreamMetrics) -> Generator[str, None, None]:
+    for chunk in response:
+        if chunk["done"] is False:
+            yield chunk["message"]["content"]
+        else:
+            # The final chunk carries Ollama's own prompt evaluation statistics
+            metrics.prompt_tokens = chunk.get("prompt_eval_count")
+
 def translate_text(text: str, dest_language: str) -> str:
-    """Translates text to the desired language using deep-translator."""
+    """Translates text to the desired language using the configured translation backend."""
     try:
+        if dest_language == 'en':
+            return text
         if not text.strip():
             return "The original response is empty. Translation is not possible."
-        translator = GoogleTranslator(source='auto', target=dest_language)
-        translated = translator.translate(text)
-        return translated
+        return translate_phrase(text, dest_language)
     except Exception as e:
         logging.error(f"An error occurred during translation: {e}")
         st.error(f"An error occurred during translation: {e}")
-        return text  # Return original text if translation fails
\ No newline at end of file
+        return text  # Return original text if translation fails
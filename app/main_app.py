@@ -1,40 +1,186 @@
 import os
+import uuid
 import logging
+import threading
+from typing import Optional
 
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 from streamlit.runtime.state import SessionState
 
-from document_processing import (
-    process_document,
-    is_document_already_processed,
-    mark_document_as_processed,
-)
+from aggregates import load_property_aggregates
+from cache import cache_answer, get_cached_answer
+from ingest import ingest_document
+from intents import IntentResult, route_question
+from manifest import DEFAULT_PROPERTY, get_dataset_version, list_properties
+from settings import config
 from vector_store import (
-    add_to_vector_collection,
-    query_collection,
     list_uploaded_documents,
     delete_document,
 )
-from llm_interface import call_llm
-from utils import normalize_scores, get_confidence_color, extract_relevant_context, format_response
-import yaml
+from llm_interface import NARRATIVE_PROMPT, translate_text
+from rate_store import load_rate_tables
+from service import QueueFullError, get_answer_service
+from snapshots import COMPETITOR_MOVE, RESTRICTION_CHANGE, UNDERCUT, default_thresholds, rate_alerts
+from telemetry import current_trace, profile_request, recent_traces, span, start_metrics_server, start_trace
+from translation import language_name
+from utils import get_confidence_color, format_response
+from warmup import start_warm_up
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
 st.set_page_config(page_title="Revenue Optimization Assistant", layout="wide")
 
-def load_config():
-    with open("config.yaml", "r") as f:
-        return yaml.safe_load(f)
+def display_confidence(confidence_score: float):
+    color = get_confidence_color(confidence_score)
+    st.markdown(f"**Confidence Score:** <span style='color:{color}'>{confidence_score:.2f}</span>", unsafe_allow_html=True)
+
+def parse_csv_response(response: str):
+    """Returns the response as a DataFrame if the model answered with CSV rows, otherwise None."""
+    import pandas as pd
+    from io import StringIO
+
+    try:
+        df = pd.read_csv(StringIO(response))
+    except Exception:
+        return None
+    return df if "Date" in df.columns and not df.empty else None
+
+def display_response(response: str):
+    # Convert response to DataFrame for better visualization
+    df = parse_csv_response(response)
+    if df is not None:
+        # Select key columns for display
+        key_columns = [col for col in ["Date", "Your Rate", "Average Competitor Rate"] if col in df.columns]
+        # Display the table
+        st.markdown("### Answer")
+        st.table(df[key_columns])  # Display the table in a structured format
+    else:
+        # If the response isn't a valid CSV, show it as markdown
+        st.markdown(response)
 
-config = load_config()
+def stream_response(response_generator) -> str:
+    """Renders tokens as they arrive, then switches to the table view if the answer is CSV."""
+    answer_placeholder = st.empty()
+    with answer_placeholder.container():
+        response = st.write_stream(response_generator)
+    if not isinstance(response, str):
+        response = "".join(str(part) for part in response)
+    if response.strip() and parse_csv_response(response) is not None:
+        with answer_placeholder.container():
+            display_response(response)
+    return response
+
+def display_intent_result(result: IntentResult, question: str, language: str, session_id: str):
+    st.markdown("### Answer")
+    st.markdown(translate_text(result.summary, language))
+    if not result.frame.empty:
+        st.dataframe(result.frame, hide_index=True)
+        if config.get("intent_narrative", False):
+            # Only a short narrative is generated; the numbers above are exact
+            try:
+                narrative = get_answer_service().submit_generation(
+                    result.frame.head(50).to_csv(index=False),
+                    NARRATIVE_PROMPT.format(question=question),
+                    language,
+                    config["llm_model"],
+                    session_id,
+                )
+                stream_response(narrative.tokens())
+            except Exception as e:
+                logging.error(f"Narrative generation failed: {e}")
+
+def display_rate_alerts(property_id: str):
+    """Sidebar panel of the latest rate shop's alerts against each file's shop of the previous day."""
+    with st.expander("Rate alerts"):
+        thresholds = default_thresholds()
+        thresholds.move_pct = st.number_input(
+            "Competitor move threshold (%)", 0.0, 100.0, float(thresholds.move_pct), step=1.0, key="alert_move_pct"
+        )
+        thresholds.undercut_margin_pct = st.number_input(
+            "Undercut margin (%)", 0.0, 100.0, float(thresholds.undercut_margin_pct), step=1.0, key="alert_undercut_margin"
+        )
+        try:
+            alerts = rate_alerts(property_id, thresholds)
+        except Exception as e:
+            logging.error(f"Error loading rate alerts: {e}")
+            st.error(f"Error loading rate alerts: {e}")
+            return
+        if alerts.empty:
+            st.caption("No alerts. Each upload is compared with the same file's rate shop of the previous day.")
+            return
+        counts = alerts["Alert"].value_counts()
+        for column, kind in zip(st.columns(3), [COMPETITOR_MOVE, UNDERCUT, RESTRICTION_CHANGE]):
+            column.metric(kind, int(counts.get(kind, 0)))
+        st.dataframe(alerts.assign(Date=alerts["Date"].dt.strftime("%Y-%m-%d")), hide_index=True)
+
+def debug_panel_enabled() -> bool:
+    """The debug panel is hidden unless `debug_panel` is set in config.yaml or the URL has `?debug=1`."""
+    return bool(config.get("debug_panel", False)) or st.query_params.get("debug") == "1"
+
+def display_trace_waterfall(trace):
+    import altair as alt
+    import pandas as pd
+
+    spans = pd.DataFrame([
+        {
+            "Stage": span.name,
+            "Start (ms)": round(span.start * 1000, 1),
+            "End (ms)": round((span.start + span.duration) * 1000, 1),
+            "Duration (ms)": round(span.duration * 1000, 1),
+            "Counts": ", ".join(f"{key}={value}" for key, value in span.counts.items()),
+        }
+        for span in trace.spans
+    ])
+    st.caption(f"{trace.name} {trace.trace_id}: {trace.duration * 1000:.0f} ms, {len(trace.spans)} spans"
+               + (f" ({trace.dropped_spans} more not shown)" if trace.dropped_spans else ""))
+    chart = alt.Chart(spans).mark_bar().encode(
+        x=alt.X("Start (ms)", title="ms"),
+        x2="End (ms)",
+        y=alt.Y("Stage", sort=None),
+        tooltip=list(spans.columns),
+    )
+    st.altair_chart(chart)
+    st.dataframe(spans, hide_index=True)
+
+def display_debug_panel():
+    with st.sidebar.expander("Debug"):
+        st.checkbox("Profile requests", key="profile_requests")
+        # recent_traces is shared by every session; show this session's own last request
+        trace_id = st.session_state.get("last_trace_id")
+        trace = next((trace for trace in list(recent_traces) if trace.trace_id == trace_id), None)
+        if trace is None:
+            st.caption("No traced requests yet.")
+            return
+        display_trace_waterfall(trace)
+        if trace.profile:
+            st.code(trace.profile, language=None)
 
 def main():
+    start_metrics_server()
+    start_warm_up()
+    with start_trace("run") as trace, profile_request(trace, st.session_state.get("profile_requests", False)):
+        run_app()
+    if trace.spans or trace.dropped_spans:
+        st.session_state["last_trace_id"] = trace.trace_id
+    if debug_panel_enabled():
+        display_debug_panel()
+
+def run_app():
     # Sidebar
     with st.sidebar:
         st.title("Revenue Optimization Assistant")
         st.markdown("Upload comp set data and identify pricing and restriction opportunities.")
+        property_id = st.selectbox(
+            "Property",
+            sorted(set(config.get("properties", [])) | set(list_properties())) or [DEFAULT_PROPERTY],
+        )
+        language = st.selectbox(
+            "Answer language",
+            config.get("languages", ["en", "de", "es"]),
+            format_func=language_name,
+        )
 
         # File uploader
         uploaded_files = st.file_uploader(
@@ -44,75 +190,150 @@ def main():
         )
         if st.button("Process Data"):
             if uploaded_files:
+                current_trace().name = "ingest"
                 with st.spinner("Processing data..."):
-                    if not is_document_already_processed(uploaded_files.name):
-                        docs = process_document(uploaded_files)
-                        if docs:
-                            add_to_vector_collection(docs, uploaded_files.name)
-                            mark_document_as_processed(uploaded_files.name)
-                            st.success(f"File '{uploaded_files.name}' processed successfully!")
-                        else:
-                            st.error(f"Processing failed for file '{uploaded_files.name}'.")
-                    else:
+                    # Files are streamed, so the row total is unknown until the end; report rows done
+                    progress_text = st.empty()
+
+                    def report_progress(done: int, _total: Optional[int]):
+                        progress_text.caption(f"Processed {done} rows")
+
+                    script_run_ctx = get_script_run_ctx()
+                    profile = st.session_state.get("profile_requests", False)
+
+                    def run_ingest():
+                        # Lets the ingest report progress and errors to this session from the bulk thread
+                        add_script_run_ctx(threading.current_thread(), script_run_ctx)
+                        # The profiler only sees its own thread; profile the ingest where it runs
+                        with profile_request(current_trace(), profile):
+                            return ingest_document(uploaded_files, property_id, progress_callback=report_progress)
+
+                    # Ingests run at bulk priority, so they never hold up other analysts' questions
+                    outcome = get_answer_service().submit_ingest(run_ingest).result()
+                    progress_text.empty()
+                    if outcome is None:
+                        st.error(f"Processing failed for file '{uploaded_files.name}'.")
+                    elif outcome["skipped"]:
                         st.warning(f"File '{uploaded_files.name}' has already been processed.")
+                    else:
+                        st.success(
+                            f"File '{uploaded_files.name}' processed successfully! "
+                            f"{outcome['changed']} rows added or updated, {outcome['removed']} removed, "
+                            f"{outcome['unchanged']} unchanged, {outcome['alerts']} rate alerts "
+                            f"against the previous day's shop."
+                        )
             else:
                 st.warning("Please upload a comp set file.")
 
+        # Documents registered for the selected property
+        documents_for_property = list_uploaded_documents(property_id)
+        if documents_for_property:
+            st.subheader("Uploaded Documents")
+            for document_name in documents_for_property:
+                name_column, delete_column = st.columns([4, 1])
+                name_column.markdown(document_name)
+                if delete_column.button("Delete", key=f"delete_{property_id}_{document_name}"):
+                    deleted = delete_document(document_name, property_id)
+                    # On failure the error stays on screen; otherwise report the outcome after the rerun
+                    if deleted is not None:
+                        st.session_state["delete_message"] = (
+                            ("success", f"Document '{document_name}' deleted successfully.") if deleted
+                            else ("info", f"No data found for document '{document_name}'.")
+                        )
+                        st.rerun()
+        delete_message = st.session_state.pop("delete_message", None)
+        if delete_message:
+            level, message = delete_message
+            getattr(st, level)(message)
+
+        display_rate_alerts(property_id)
+
     # Main Content
     st.title("Revenue Optimization Insights")
+    position = load_property_aggregates(list_uploaded_documents(property_id), property_id)
+    if position is not None and not position.empty:
+        with st.expander("Rate position overview"):
+            st.line_chart(position[["Your Rate", "Average Competitor Rate", "Average Competitor Rate 7d Avg"]])
+            st.bar_chart(position["Rank"])
     st.header("Ask a Question")
     question = st.text_area("Enter your question (e.g., 'Which days am I overpriced?'):", key="question_input")
-    n_results = st.slider("Number of records to retrieve:", 1, 20, 10, key="n_results_slider")
+    session_id = st.session_state.setdefault("session_id", uuid.uuid4().hex)
+    # An edited question makes the previous answer obsolete: stop generating it
+    get_answer_service().cancel_session(session_id, unless_question=question)
+    n_results = st.slider("Number of records to retrieve:", 1, 20, 5, key="n_results_slider")
     if st.button("Get Insights"):
         if question.strip():  # Ensure the question is not empty or whitespace
+            current_trace().name = "question"
+            dataset_version = get_dataset_version(property_id)
+            with span("answer_cache.lookup"):
+                cached = get_cached_answer(question, n_results, dataset_version, config["llm_model"], language)
+            if cached:
+                logging.info("Answer served from cache.")
+                display_confidence(cached["confidence"])
+                display_response(cached["response"])
+                return
+
+            # Analytic questions are answered exactly from the rate tables, without the LLM
+            property_documents = list_uploaded_documents(property_id)
+            with span("intent.route") as counts:
+                rate_tables = load_rate_tables(property_documents, property_id)
+                try:
+                    intent_result = route_question(
+                        question, rate_tables, load_property_aggregates(property_documents, property_id)
+                    )
+                except Exception as e:
+                    # A failing analytic handler must not cost the answer; fall back to retrieval
+                    logging.error(f"Intent routing failed for question '{question}': {e}")
+                    intent_result = None
+                counts["rows"] = len(intent_result.frame) if intent_result is not None else 0
+            if intent_result is not None:
+                logging.info(f"Question routed to intent '{intent_result.intent}'.")
+                display_intent_result(intent_result, question, language, session_id)
+                return
+
+            # Retrieval and generation run in the shared service; identical questions in flight share one answer
+            try:
+                answer = get_answer_service().submit_question(
+                    question, property_id, n_results, language, config["llm_model"], dataset_version, session_id,
+                    profile=st.session_state.get("profile_requests", False),
+                )
+            except QueueFullError as e:
+                st.warning(str(e))
+                return
             with st.spinner("Analyzing..."):
-                # Query the vector store and generate an answer
-                results = query_collection(question, n_results)
-                if results and 'documents' in results and 'distances' in results:
-                    documents = results['documents'][0] if results['documents'] else []
-                    distances = results['distances'][0] if results['distances'] else []
-
-                    if not documents or not distances:
-                        st.warning("No relevant documents were found for your query.")
-                        return  # Skip further processing
-                    
-                    # Normalize retrieval scores
-                    retrieval_scores = normalize_scores(distances)
-
-                    # Calculate confidence score
-                    confidence_score = sum(retrieval_scores) / len(retrieval_scores) if retrieval_scores else 0.0
-                    color = get_confidence_color(confidence_score)
-                    st.markdown(f"**Confidence Score:** <span style='color:{color}'>{confidence_score:.2f}</span>", unsafe_allow_html=True)
-
-                    # Extract relevant context for the question
-                    context = " ".join(documents)
-                    relevant_context = extract_relevant_context(context, question)
-                    
-                    # Generate response using the LLM
-                    response_generator = call_llm(relevant_context, question, "en")
-                    response = "".join(chunk for chunk in response_generator)
-
-                    # Format and display the response
-                    if response.strip():
-                        # Convert response to DataFrame for better visualization
-                        import pandas as pd
-                        from io import StringIO
-
-                        try:
-                            # Attempt to parse the response into a DataFrame
-                            df = pd.read_csv(StringIO(response))
-                            # Select key columns for display
-                            display_df = df[["Date", "Your Rate", "Average Competitor Rate"]]
-                            # Display the table
-                            st.markdown("### Answer")
-                            st.table(display_df)  # Display the table in a structured format
-                        except Exception as e:
-                            # If the response isn't a valid CSV, show it as markdown
-                            st.markdown(response)
-                    else:
-                        st.warning("No response generated. Please refine your question.")
-                else:
-                    st.warning("No relevant data found.")
+                try:
+                    prepared = answer.prepared()
+                except Exception as e:
+                    answer.cancel()
+                    st.error(f"An error occurred while retrieving data: {e}")
+                    return
+            if prepared is None:
+                answer.cancel()
+                st.warning("No relevant documents were found for your query.")
+                return
+
+            display_confidence(prepared.confidence)
+            context_report = prepared.context_report
+            st.caption(
+                f"Context: {context_report.rows_included}/{context_report.rows_available} rows, "
+                f"~{context_report.context_tokens} tokens ({context_report.tokens_saved} saved)"
+            )
+
+            # Render tokens as they stream in; leaving the page or editing the question cancels the generation
+            try:
+                response = stream_response(answer.tokens())
+            except Exception as e:
+                logging.error(f"An error occurred while generating the response: {e}")
+                st.error(f"An error occurred while generating the response: {e}")
+                return
+
+            if response.strip():
+                cache_answer(
+                    question, n_results, dataset_version, config["llm_model"],
+                    {"response": response, "confidence": prepared.confidence}, language,
+                )
+            else:
+                st.warning("No response generated. Please refine your question.")
         else:
             st.warning("Please enter a valid question.")
 
@@ -0,0 +1,140 @@
+import os
+import copy
+import json
+import hashlib
+import logging
+import threading
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from settings import config
+
+# The registry: {property_id: {file_name: {"content_hash"}}}, small enough to read on every rerun
+MANIFEST_PATH = config.get("manifest_path", "./ingest_manifest.json")
+# Per-file row hashes ({date: row_hash}), only read when that file is re-ingested
+ROW_HASH_STORE_PATH = config.get("row_hash_store_path", "./row_hashes")
+
+DEFAULT_PROPERTY = "default"
+
+_manifest_lock = threading.Lock()
+
+def compute_content_hash(data: bytes) -> str:
+    """Returns a stable hash of a file's full content."""
+    return hashlib.sha256(data).hexdigest()
+
+def compute_file_hash(file, block_size: int = 1 << 20) -> str:
+    """Hashes an open file's full content in fixed-size blocks and rewinds it."""
+    digest = hashlib.sha256()
+    position = file.tell()
+    for block in iter(lambda: file.read(block_size), b"" if "b" in getattr(file, "mode", "b") else ""):
+        digest.update(block.encode() if isinstance(block, str) else block)
+    file.seek(position)
+    return digest.hexdigest()
+
+def compute_row_hash(row_text: str) -> str:
+    """Returns a stable hash of one serialized data row (CSV header + Date, rates and restrictions)."""
+    return hashlib.md5(row_text.encode()).hexdigest()
+
+def document_id(file_name: str, row_key: str) -> str:
+    """Builds the vector store ID for one row of a document."""
+    return f"{file_name}::{row_key}"
+
+@lru_cache(maxsize=4)
+def _read_manifest(path: str, version: Tuple[int, int, int]) -> Dict[str, Dict[str, dict]]:
+    try:
+        with open(path, "r") as f:
+            manifest = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        logging.error(f"Could not read ingest manifest '{path}': {e}")
+        return {}
+    if any("content_hash" in entry for entry in manifest.values()):
+        manifest = {DEFAULT_PROPERTY: manifest}
+    return manifest
+
+def load_manifest() -> Dict[str, Dict[str, dict]]:
+    """
+    Loads the persistent document registry ({property_id: {file_name: entry}}), returning an
+    empty one if none exists. Manifests written before properties existed are read as
+    belonging to the default property. The result is cached until the file changes and
+    must not be modified.
+    """
+    try:
+        stat = os.stat(MANIFEST_PATH)
+    except FileNotFoundError:
+        return {}
+    # The manifest is replaced, never rewritten in place: a new inode means new content
+    return _read_manifest(MANIFEST_PATH, (stat.st_ino, stat.st_mtime_ns, stat.st_size))
+
+def _safe_name(name: str) -> str:
+    return name.replace(os.sep, "_").replace("/", "_")
+
+def _row_hash_path(file_name: str, property_id: str) -> str:
+    return os.path.join(ROW_HASH_STORE_PATH, _safe_name(property_id), f"{_safe_name(file_name)}.json")
+
+def _write_json(path: str, data):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def _save_manifest(manifest: Dict[str, Dict[str, dict]]):
+    # Manifests written before the split keep every file's row hashes inline; move them out
+    for property_id, documents in manifest.items():
+        for file_name, entry in documents.items():
+            if "rows" in entry:
+                _write_json(_row_hash_path(file_name, property_id), entry.pop("rows"))
+    _write_json(MANIFEST_PATH, manifest)
+
+def list_properties() -> List[str]:
+    """Returns the properties that have ingested documents."""
+    return sorted(property_id for property_id, documents in load_manifest().items() if documents)
+
+def list_documents(property_id: str = DEFAULT_PROPERTY) -> List[str]:
+    """Returns the documents registered for a property, without touching the vector store."""
+    return sorted(load_manifest().get(property_id, {}))
+
+def get_document_entry(file_name: str, property_id: str = DEFAULT_PROPERTY) -> Optional[dict]:
+    """Returns the registry entry ({'content_hash'}) for a document, if any."""
+    return load_manifest().get(property_id, {}).get(file_name)
+
+def load_row_hashes(file_name: str, property_id: str = DEFAULT_PROPERTY) -> Dict[str, str]:
+    """Returns the per-row hashes ({date: row_hash}) recorded for the last ingest of a document."""
+    entry = get_document_entry(file_name, property_id)
+    if entry is None:
+        return {}
+    if "rows" in entry:
+        return dict(entry["rows"])
+    try:
+        with open(_row_hash_path(file_name, property_id), "r") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        logging.error(f"Could not read row hashes of '{file_name}': {e}")
+        return {}
+
+def get_dataset_version(property_id: str = DEFAULT_PROPERTY) -> str:
+    """Returns a hash identifying a property's ingested documents and their contents."""
+    documents = load_manifest().get(property_id, {})
+    fingerprint = "\n".join(f"{name}:{documents[name].get('content_hash', '')}" for name in sorted(documents))
+    return hashlib.md5(f"{property_id}\n{fingerprint}".encode()).hexdigest()
+
+def update_document_entry(file_name: str, content_hash: str, row_hashes: Dict[str, str],
+                          property_id: str = DEFAULT_PROPERTY):
+    """Records the content hash and per-row hashes of an ingested document."""
+    with _manifest_lock:
+        # Row hashes first: a registered file always has the row hashes of its content
+        _write_json(_row_hash_path(file_name, property_id), row_hashes)
+        manifest = copy.deepcopy(load_manifest())
+        manifest.setdefault(property_id, {})[file_name] = {"content_hash": content_hash}
+        _save_manifest(manifest)
+
+def remove_document_entry(file_name: str, property_id: str = DEFAULT_PROPERTY):
+    """Forgets a document so that its next upload is ingested from scratch."""
+    with _manifest_lock:
+        manifest = copy.deepcopy(load_manifest())
+        if manifest.get(property_id, {}).pop(file_name, None) is not None:
+            _save_manifest(manifest)
+        try:
+            os.remove(_row_hash_path(file_name, property_id))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,102 @@
+import re
+from datetime import date, timedelta
+from typing import List, Optional, Tuple
+
+import pandas as pd
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+MONTHS = [
+    "january", "february", "march", "april", "may", "june",
+    "july", "august", "september", "october", "november", "december",
+]
+
+_ISO_DATE = re.compile(r"\b(\d{4}-\d{2}-\d{2})\b")
+_NEXT_DAYS = re.compile(r"\bnext (\d+) days\b")
+
+def parse_date_range(question: str, today: Optional[date] = None) -> Optional[Tuple[pd.Timestamp, pd.Timestamp]]:
+    """
+    Extracts an inclusive stay-date range from a question: explicit ISO dates
+    ("2024-01-05", "from 2024-01-05 to 2024-01-10") or relative phrases
+    ("next 14 days", "next week", "this weekend", "next weekend").
+    """
+    question_lower = question.lower()
+    dates = sorted(pd.Timestamp(d) for d in _ISO_DATE.findall(question_lower))
+    if dates:
+        return dates[0], dates[-1]
+
+    today = today or date.today()
+    match = _NEXT_DAYS.search(question_lower)
+    if match:
+        return pd.Timestamp(today), pd.Timestamp(today + timedelta(days=int(match.group(1)) - 1))
+    if "next week" in question_lower:
+        start = today + timedelta(days=7 - today.weekday())
+        return pd.Timestamp(start), pd.Timestamp(start + timedelta(days=6))
+    if "this weekend" in question_lower or "next weekend" in question_lower:
+        saturday = today + timedelta(days=(5 - today.weekday()) % 7)
+        if "next weekend" in question_lower and saturday - today < timedelta(days=2):
+            saturday += timedelta(days=7)
+        return pd.Timestamp(saturday - timedelta(days=1)), pd.Timestamp(saturday + timedelta(days=1))
+    return None
+
+def parse_weekdays(question: str) -> List[int]:
+    """Returns the weekday numbers (Monday=0) mentioned in a question."""
+    question_lower = question.lower()
+    weekdays = [i for i, name in enumerate(WEEKDAYS) if re.search(rf"\b{name[:3]}(?:{name[3:]})?s?\b", question_lower)]
+    if not weekdays and re.search(r"\bweekends?\b", question_lower) and parse_date_range(question) is None:
+        weekdays = [4, 5]
+    return weekdays
+
+def parse_months(question: str) -> List[int]:
+    """Returns the month numbers (January=1) mentioned by name in a question."""
+    question_lower = question.lower()
+    months = []
+    for i, name in enumerate(MONTHS, start=1):
+        # "may" is also a verb, so only match it next to a preposition or a day/year
+        if name == "may":
+            pattern = r"\b(?:in|of|during|for) may\b|\bmay \d"
+        else:
+            pattern = rf"\b{name[:3]}(?:{name[3:]})?\b"
+        if re.search(pattern, question_lower):
+            months.append(i)
+    return months
+
+def filter_table_by_question(table: pd.DataFrame, question: str) -> pd.DataFrame:
+    """Restricts a date-indexed table to the dates, weekdays and months named in the question."""
+    date_range = parse_date_range(question)
+    if date_range:
+        table = table.loc[date_range[0]:date_range[1]]
+    weekdays = parse_weekdays(question)
+    if weekdays:
+        table = table[table.index.weekday.isin(weekdays)]
+    months = parse_months(question)
+    if months:
+        table = table[table.index.month.isin(months)]
+    return table
+
+def build_where_filter(question: str) -> Optional[dict]:
+    """
+    Translates the dates, weekdays, months and pricing conditions in a question into a
+    Chroma `where` clause over the per-row metadata, or None if nothing can be extracted.
+    """
+    question_lower = question.lower()
+    conditions = []
+    date_range = parse_date_range(question)
+    if date_range:
+        conditions.append({"date_ordinal": {"$gte": int(date_range[0].strftime("%Y%m%d"))}})
+        conditions.append({"date_ordinal": {"$lte": int(date_range[1].strftime("%Y%m%d"))}})
+    weekdays = parse_weekdays(question)
+    if weekdays:
+        conditions.append({"weekday": {"$in": weekdays}})
+    months = parse_months(question)
+    if months:
+        conditions.append({"month": {"$in": months}})
+    if "overpriced" in question_lower:
+        conditions.append({"rate_delta": {"$gt": 0}})
+    elif "underpriced" in question_lower:
+        conditions.append({"rate_delta": {"$lt": 0}})
+    if "min los" in question_lower or "length of stay" in question_lower:
+        conditions.append({"min_los": {"$gt": 1}})
+
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
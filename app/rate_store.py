@@ -0,0 +1,229 @@
+import os
+import logging
+from functools import lru_cache
+from typing import Iterable, Iterator, List, Optional
+
+import pandas as pd
+
+from manifest import DEFAULT_PROPERTY
+from settings import config
+
+RATE_STORE_PATH = config.get("rate_store_path", "./rate_store")
+INGEST_BATCH_ROWS = config.get("ingest_batch_rows", 5000)
+
+REQUIRED_COLUMNS = ["Date", "Your Rate", "Competitor Rates", "Min LOS", "Advance Purchase"]
+OWN_RATE_COLUMN = "Your Rate"
+AGGREGATE_COMPETITOR_COLUMN = "Competitor Rates"
+RESTRICTION_COLUMNS = ["Min LOS", "Advance Purchase"]
+AVERAGE_COLUMN = "Average Competitor Rate"
+
+def read_comp_set(file, file_name: Optional[str] = None) -> pd.DataFrame:
+    """Reads a CSV or Excel comp set file (path or file object) and validates its columns."""
+    file_name = file_name or getattr(file, "name", str(file))
+    if file_name.endswith(".csv"):
+        df = pd.read_csv(file)
+    elif file_name.endswith(".xlsx"):
+        df = pd.read_excel(file)
+    else:
+        raise ValueError("Unsupported file type. Please upload a CSV or Excel file.")
+    missing_columns = _missing_columns(df)
+    if missing_columns:
+        raise ValueError(f"Missing required columns: {', '.join(missing_columns)}")
+    return df
+
+def _missing_columns(df: pd.DataFrame) -> List[str]:
+    return [col for col in REQUIRED_COLUMNS if col not in df.columns]
+
+def _iter_xlsx_batches(file, batch_size: int) -> Iterator[pd.DataFrame]:
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        header = [str(col) if col is not None else "" for col in header]
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                yield pd.DataFrame(batch, columns=header)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=header)
+    finally:
+        workbook.close()
+
+def iter_comp_set_batches(file, batch_size: int = INGEST_BATCH_ROWS, file_name: Optional[str] = None) -> Iterator[pd.DataFrame]:
+    """
+    Reads a CSV or Excel comp set file in bounded-size row batches so memory stays constant
+    regardless of file size. Required columns are validated on the first batch.
+    """
+    file_name = file_name or getattr(file, "name", str(file))
+    if file_name.endswith(".csv"):
+        batches = pd.read_csv(file, chunksize=batch_size)
+    elif file_name.endswith(".xlsx"):
+        batches = _iter_xlsx_batches(file, batch_size)
+    else:
+        raise ValueError("Unsupported file type. Please upload a CSV or Excel file.")
+    for i, batch in enumerate(batches):
+        if i == 0:
+            missing_columns = _missing_columns(batch)
+            if missing_columns:
+                raise ValueError(f"Missing required columns: {', '.join(missing_columns)}")
+        yield batch
+
+def competitor_columns(df: pd.DataFrame) -> List[str]:
+    """Returns the per-competitor rate columns, falling back to the consolidated column."""
+    columns = [
+        col for col in df.columns
+        if "Competitor" in col and col not in (AGGREGATE_COMPETITOR_COLUMN, AVERAGE_COLUMN)
+    ]
+    if not columns and AGGREGATE_COMPETITOR_COLUMN in df.columns:
+        columns = [AGGREGATE_COMPETITOR_COLUMN]
+    return columns
+
+def build_rate_table(df: pd.DataFrame) -> pd.DataFrame:
+    """Converts a raw comp set DataFrame into a typed, date-indexed columnar rate table."""
+    comp_columns = competitor_columns(df)
+    table = pd.DataFrame(index=pd.DatetimeIndex(pd.to_datetime(df["Date"], errors="coerce"), name="Date"))
+    table[OWN_RATE_COLUMN] = pd.to_numeric(df[OWN_RATE_COLUMN], errors="coerce").to_numpy(dtype="float64")
+    for col in comp_columns:
+        table[col] = pd.to_numeric(df[col], errors="coerce").to_numpy(dtype="float64")
+    for col in RESTRICTION_COLUMNS:
+        table[col] = pd.to_numeric(df[col], errors="coerce").to_numpy(dtype="float64")
+    table = table[table.index.notna()]
+    return table[~table.index.duplicated(keep="last")].sort_index()
+
+def _safe_name(name: str) -> str:
+    return name.replace(os.sep, "_").replace("/", "_")
+
+def store_path(file_name: str, property_id: str = DEFAULT_PROPERTY, kind: str = "rates") -> str:
+    """Returns the Parquet path of a stored table ('rates' or a derived kind such as 'aggregates')."""
+    # Tables of the default property stay at the top level, where they were stored before properties existed
+    directory = RATE_STORE_PATH if property_id == DEFAULT_PROPERTY else os.path.join(RATE_STORE_PATH, _safe_name(property_id))
+    suffix = ".parquet" if kind == "rates" else f".{kind}.parquet"
+    return os.path.join(directory, f"{_safe_name(file_name)}{suffix}")
+
+class RateTableWriter:
+    """
+    Appends typed rate-table batches to a Parquet file as they are read, so a large upload
+    never has to be held in memory. The file replaces the previous table on close.
+    """
+
+    def __init__(self, file_name: str, property_id: str = DEFAULT_PROPERTY):
+        self.file_name = file_name
+        self.path = store_path(file_name, property_id)
+        self._tmp_path = f"{self.path}.tmp"
+        self._writer = None
+        self.rows = 0
+
+    def write(self, table: pd.DataFrame):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if self._writer is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            arrow_table = pa.Table.from_pandas(table, preserve_index=True)
+            self._writer = pq.ParquetWriter(self._tmp_path, arrow_table.schema)
+        else:
+            arrow_table = pa.Table.from_pandas(table, schema=self._writer.schema, preserve_index=True)
+        self._writer.write_table(arrow_table)
+        self.rows += len(table)
+
+    def close(self):
+        if self._writer is None:
+            return
+        self._writer.close()
+        os.replace(self._tmp_path, self.path)
+        logging.info(f"Saved rate table for '{self.file_name}' ({self.rows} dates) to {self.path}.")
+
+    def abort(self):
+        if self._writer is not None:
+            self._writer.close()
+            os.remove(self._tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+@lru_cache(maxsize=32)
+def _read_rate_table(path: str, mtime: float) -> pd.DataFrame:
+    table = pd.read_parquet(path)
+    # Tables written batch by batch may repeat dates across batches
+    if not table.index.is_monotonic_increasing or table.index.has_duplicates:
+        table = table[~table.index.duplicated(keep="last")].sort_index()
+    return table
+
+def load_rate_table(file_name: str, property_id: str = DEFAULT_PROPERTY) -> Optional[pd.DataFrame]:
+    """Loads the persisted rate table for a file, or None if it was never stored."""
+    path = store_path(file_name, property_id)
+    if not os.path.exists(path):
+        return None
+    return _read_rate_table(path, os.path.getmtime(path))
+
+def load_rate_tables(file_names: Iterable[str], property_id: str = DEFAULT_PROPERTY) -> Optional[pd.DataFrame]:
+    """Loads and combines the rate tables for several files of one property."""
+    tables = [
+        table for table in (load_rate_table(name, property_id) for name in sorted(set(file_names)))
+        if table is not None
+    ]
+    if not tables:
+        return None
+    if len(tables) == 1:
+        return tables[0]
+    combined = pd.concat(tables)
+    return combined[~combined.index.duplicated(keep="last")].sort_index()
+
+def delete_rate_table(file_name: str, property_id: str = DEFAULT_PROPERTY):
+    """Removes the persisted rate table for a file, if any."""
+    path = store_path(file_name, property_id)
+    if os.path.exists(path):
+        os.remove(path)
+
+def with_average(table: pd.DataFrame) -> pd.DataFrame:
+    """Returns the table with an 'Average Competitor Rate' column, computed vectorized."""
+    result = table.copy()
+    result[AVERAGE_COLUMN] = table[competitor_columns(table)].mean(axis=1)
+    return result
+
+def to_frame(table: pd.DataFrame) -> pd.DataFrame:
+    """Turns the date index back into an ISO 'Date' column for display and serialization."""
+    frame = table.reset_index()
+    frame["Date"] = frame["Date"].dt.strftime("%Y-%m-%d")
+    return frame
+
+def overpriced_days(table: pd.DataFrame) -> pd.DataFrame:
+    """Days where the own rate is above the competitor average."""
+    table = with_average(table)
+    return table[table[OWN_RATE_COLUMN] > table[AVERAGE_COLUMN]]
+
+def underpriced_days(table: pd.DataFrame) -> pd.DataFrame:
+    """Days where the own rate is below the competitor average."""
+    table = with_average(table)
+    return table[table[OWN_RATE_COLUMN] < table[AVERAGE_COLUMN]]
+
+def competitor_rate_extremes(table: pd.DataFrame, highest: bool = True) -> pd.DataFrame:
+    """Per-date highest (or lowest) competitor rate and the competitor offering it, best first."""
+    rates = table[competitor_columns(table)].dropna(how="all")
+    # Built on the rates' own index so an empty result keeps the 'Date' index name
+    if highest:
+        result = pd.DataFrame({"Competitor": rates.idxmax(axis=1), "Competitor Rate": rates.max(axis=1)}, index=rates.index)
+    else:
+        result = pd.DataFrame({"Competitor": rates.idxmin(axis=1), "Competitor Rate": rates.min(axis=1)}, index=rates.index)
+    result[OWN_RATE_COLUMN] = table.loc[result.index, OWN_RATE_COLUMN]
+    return result.sort_values("Competitor Rate", ascending=not highest, kind="stable")
+
+def restricted_days(table: pd.DataFrame, column: Optional[str] = None) -> pd.DataFrame:
+    """Restriction values per date, limited to one restriction column if given."""
+    columns = [column] if column else RESTRICTION_COLUMNS
+    result = table[[OWN_RATE_COLUMN] + columns]
+    if column == "Min LOS":
+        result = result[result["Min LOS"] > 1]
+    return result
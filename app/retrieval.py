@@ -0,0 +1,208 @@
+import math
+import logging
+import operator
+from functools import lru_cache
+from typing import Dict, List, Optional, Set
+
+import numpy as np
+
+from lexical_index import get_lexical_index
+from manifest import DEFAULT_PROPERTY
+from question_filters import parse_date_range
+from settings import config
+from telemetry import span
+from vector_store import embed_query, get_embeddings, query_collection, sync_lexical_index
+
+# Candidates taken from each retriever before fusion; the fused list is cut to n_results
+RETRIEVAL_CANDIDATES = config.get("retrieval_candidates", 20)
+# Reciprocal rank fusion constant: higher values flatten the advantage of the top ranks
+RRF_K = config.get("rrf_k", 60)
+# An exact date match outranks the top hit of any single other retriever
+RETRIEVAL_WEIGHTS = {"vector": 1.0, "lexical": 1.0, "date": 2.0, **config.get("retrieval_weights", {})}
+# Rows of the asked-for dates fetched for fusion; a wider range ("this year") is no exact
+# match worth boosting, and date fusion is skipped for it
+DATE_MATCH_LIMIT = config.get("date_match_limit", 400)
+
+# Heuristic weights of a record's confidence, hand-set rather than fitted on labelled data:
+# slope * (cosine similarity - midpoint) + date * exact date match + lexical * matched query terms
+CONFIDENCE_CALIBRATION = {
+    "slope": 10.0,
+    "midpoint": 0.55,
+    "date": 3.0,
+    "lexical": 2.0,
+    "reranker": 1.0,
+    **config.get("confidence_calibration", {}),
+}
+
+# Properties whose lexical index was checked against Chroma in this process
+_synced_properties: Set[str] = set()
+
+_OPERATORS = {
+    "$eq": operator.eq,
+    "$ne": operator.ne,
+    "$gt": operator.gt,
+    "$gte": operator.ge,
+    "$lt": operator.lt,
+    "$lte": operator.le,
+    "$in": lambda value, options: value in options,
+    "$nin": lambda value, options: value not in options,
+}
+
+def matches_where(metadata: dict, where: Optional[dict]) -> bool:
+    """Evaluates a Chroma `where` clause (as built by `build_where_filter`) against one chunk's metadata."""
+    if not where:
+        return True
+    if "$and" in where:
+        return all(matches_where(metadata, clause) for clause in where["$and"])
+    if "$or" in where:
+        return any(matches_where(metadata, clause) for clause in where["$or"])
+    for key, condition in where.items():
+        value = metadata.get(key)
+        conditions = condition if isinstance(condition, dict) else {"$eq": condition}
+        if value is None or not all(_OPERATORS[op](value, operand) for op, operand in conditions.items()):
+            return False
+    return True
+
+def reciprocal_rank_fusion(rankings: Dict[str, Dict[str, int]], weights: Dict[str, float],
+                           k: int = RRF_K) -> List[str]:
+    """
+    Fuses {source: {id: rank}} rankings into one list of IDs, best first: each source adds
+    weight / (k + rank) to an ID's score. Sources may give several IDs the same rank.
+    """
+    scores: Dict[str, float] = {}
+    for source, ranks in rankings.items():
+        for chunk_id, rank in ranks.items():
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + weights.get(source, 1.0) / (k + rank)
+    return sorted(scores, key=lambda chunk_id: -scores[chunk_id])
+
+@lru_cache(maxsize=1)
+def get_reranker():
+    """
+    Returns the optional CPU cross-encoder reranker (config `reranker: cross-encoder`,
+    `reranker_model`), or None if disabled or sentence-transformers is not installed.
+    """
+    if config.get("reranker") != "cross-encoder":
+        return None
+    try:
+        from sentence_transformers import CrossEncoder
+    except ImportError:
+        logging.warning("sentence-transformers is not installed; retrieval results are not reranked.")
+        return None
+    return CrossEncoder(config.get("reranker_model", "cross-encoder/ms-marco-MiniLM-L-6-v2"), device="cpu")
+
+def calibrated_confidence(similarity: float, date_match: bool, lexical_coverage: float,
+                          reranker_score: Optional[float] = None) -> float:
+    """
+    Maps a record's retrieval evidence to a confidence between 0 and 1 through a logistic of
+    heuristic weights (`CONFIDENCE_CALIBRATION`), not a model fitted to labelled answers.
+    Unlike min-max scaling per query, the same evidence always gets the same score, so a query
+    whose best hits are poor gets a low confidence instead of 1.0. The fused rank score is left
+    out on purpose: it only says how a record compares with the other hits of its query.
+    """
+    c = CONFIDENCE_CALIBRATION
+    logit = c["slope"] * (similarity - c["midpoint"]) + c["date"] * date_match + c["lexical"] * lexical_coverage
+    if reranker_score is not None:
+        logit += c["reranker"] * reranker_score
+    return 1.0 / (1.0 + math.exp(-logit))
+
+def _cosine_similarity(a, b) -> float:
+    a, b = np.asarray(a, dtype=float), np.asarray(b, dtype=float)
+    norm = np.linalg.norm(a) * np.linalg.norm(b)
+    return float(a @ b / norm) if norm else 0.0
+
+def retrieve(question: str, n_results: int = 10, where: Optional[dict] = None,
+             property_id: str = DEFAULT_PROPERTY) -> dict:
+    """
+    Hybrid retrieval: Chroma vector search, BM25 over row values and an exact date index,
+    fused with reciprocal rank fusion and optionally reranked by a cross-encoder.
+
+    Returns Chroma-style results ({"ids", "documents", "metadatas", "distances"}, one list per
+    query) plus "scores", the calibrated confidence of each record. Raises if the vector search
+    fails (e.g. the embedding endpoint is down), so callers on worker threads can report it.
+    """
+    candidates = max(n_results, RETRIEVAL_CANDIDATES)
+    if property_id not in _synced_properties:
+        sync_lexical_index(property_id)
+        _synced_properties.add(property_id)
+    results = query_collection(question, candidates, where=where, property_id=property_id, raise_errors=True)
+
+    records: Dict[str, tuple] = {}
+    similarities: Dict[str, float] = {}
+    for chunk_id, document, metadata, distance in zip(
+        results["ids"][0], results["documents"][0], results["metadatas"][0], results["distances"][0]
+    ):
+        records[chunk_id] = (document, metadata)
+        # Cosine distance of the collection's "hnsw:space": similarity = 1 - distance
+        similarities[chunk_id] = 1.0 - distance
+    rankings = {"vector": {chunk_id: rank for rank, chunk_id in enumerate(results["ids"][0], start=1)}}
+
+    coverage: Dict[str, float] = {}
+    date_matches = set()
+    lexical_index = get_lexical_index()
+    if lexical_index is not None:
+        with span("lexical.query") as counts:
+            hits = lexical_index.search(property_id, question, candidates)
+            counts["chunks"] = len(hits)
+        date_range = parse_date_range(question)
+        if date_range:
+            with span("date_index.query") as counts:
+                date_ids = lexical_index.dates(
+                    property_id, date_range[0].strftime("%Y-%m-%d"), date_range[1].strftime("%Y-%m-%d"),
+                    DATE_MATCH_LIMIT + 1,
+                )
+                counts["chunks"] = len(date_ids)
+            if len(date_ids) > DATE_MATCH_LIMIT:
+                logging.info(f"Date range of '{question}' matches over {DATE_MATCH_LIMIT} rows; not fused as exact matches.")
+                date_ids = []
+        else:
+            date_ids = []
+        missing = [chunk_id for chunk_id, _, _ in hits if chunk_id not in records]
+        missing += [chunk_id for chunk_id in date_ids if chunk_id not in records]
+        records.update(lexical_index.get(property_id, missing))
+
+        # Lexical and date hits obey the same metadata filter as the vector search
+        hits = [hit for hit in hits if hit[0] in records and matches_where(records[hit[0]][1], where)]
+        date_ids = [chunk_id for chunk_id in date_ids if chunk_id in records and matches_where(records[chunk_id][1], where)]
+        rankings["lexical"] = {chunk_id: rank for rank, (chunk_id, _, _) in enumerate(hits, start=1)}
+        # Every row of the asked-for dates is an exact match; they share the top rank
+        rankings["date"] = {chunk_id: 1 for chunk_id in date_ids}
+        coverage = {chunk_id: share for chunk_id, _, share in hits}
+        date_matches = set(date_ids)
+
+    with span("fusion") as counts:
+        fused = reciprocal_rank_fusion(rankings, RETRIEVAL_WEIGHTS)
+        counts["chunks"] = len(fused)
+
+    reranker_scores: Dict[str, float] = {}
+    reranker = get_reranker()
+    if reranker is not None and fused:
+        # Rerank a short list only; cross-encoders cost one forward pass per pair
+        shortlist = fused[:max(n_results * 2, 10)]
+        with span("rerank", chunks=len(shortlist)):
+            scores = reranker.predict([(question, records[chunk_id][0]) for chunk_id in shortlist])
+        reranker_scores = dict(zip(shortlist, (float(score) for score in scores)))
+        fused = sorted(shortlist, key=lambda chunk_id: -reranker_scores[chunk_id])
+    selected = fused[:n_results]
+
+    # Records found only lexically have no distance yet; compare their stored embeddings
+    unscored = [chunk_id for chunk_id in selected if chunk_id not in similarities]
+    if unscored:
+        query_embedding = embed_query(question)
+        for chunk_id, embedding in get_embeddings(unscored, property_id).items():
+            similarities[chunk_id] = _cosine_similarity(query_embedding, embedding)
+
+    return {
+        "ids": [selected],
+        "documents": [[records[chunk_id][0] for chunk_id in selected]],
+        "metadatas": [[records[chunk_id][1] for chunk_id in selected]],
+        "distances": [[1.0 - similarities.get(chunk_id, 0.0) for chunk_id in selected]],
+        "scores": [[
+            calibrated_confidence(
+                similarities.get(chunk_id, 0.0),
+                chunk_id in date_matches,
+                coverage.get(chunk_id, 0.0),
+                reranker_scores.get(chunk_id),
+            )
+            for chunk_id in selected
+        ]],
+    }
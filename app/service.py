@@ -0,0 +1,382 @@
+"""
+Asynchronous service layer between the Streamlit sessions and Ollama / the vector store.
+
+One event loop runs in a background thread and serves every session:
+
+- jobs wait in a bounded priority queue; interactive questions are taken before bulk ingest
+- at most `service_workers` jobs run at once, and at most `bulk_concurrency` of them are ingests
+- LLM generations hold a per-model slot (`model_concurrency`), so the Ollama host never
+  sees more parallel requests than configured, however many analysts are asking
+- identical questions that are already in flight share one job (and one generation)
+- a session's previous question is cancelled when it asks a new one or stops reading
+"""
+import time
+import asyncio
+import contextvars
+import logging
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from cache import normalize_question
+from context_builder import ContextReport
+from settings import config
+
+INTERACTIVE = 0
+BULK = 10
+
+class QueueFullError(RuntimeError):
+    """Raised when the job queue is at capacity; the caller should ask the user to retry."""
+
+@dataclass
+class PreparedAnswer:
+    """Retrieval result of a question, available before the LLM starts streaming."""
+    context: str
+    confidence: float
+    context_report: Optional[ContextReport]
+
+def prepare_answer(question: str, property_id: str, n_results: int, model: str) -> Optional[PreparedAnswer]:
+    """
+    Retrieves the records for a question and packs the prompt context. Returns None if
+    nothing relevant was found; raises if retrieval fails.
+    """
+    from aggregates import load_property_aggregates
+    from context_builder import build_context
+    from question_filters import build_where_filter
+    from rate_store import load_rate_tables
+    from retrieval import retrieve
+    from telemetry import span
+
+    results = retrieve(question, n_results, where=build_where_filter(question), property_id=property_id)
+    if not results or not results.get("documents"):
+        return None
+    documents = results["documents"][0]
+    scores = results["scores"][0]
+    metadatas = results["metadatas"][0] if results.get("metadatas") else []
+    if not documents:
+        return None
+
+    # Mean calibrated confidence of the retrieved records
+    confidence = sum(scores) / len(scores)
+
+    # Pack only the needed rows of the stored rate tables into the prompt
+    retrieved_files = [m["file_name"] for m in metadatas if m and "file_name" in m]
+    with span("context.extract") as counts:
+        rate_table = load_rate_tables(retrieved_files, property_id)
+        aggregates = load_property_aggregates(retrieved_files, property_id)
+        context, report = build_context(question, rate_table, documents, metadatas, model, aggregates)
+        counts.update(rows=report.rows_included, prompt_tokens=report.context_tokens)
+    return PreparedAnswer(context, confidence, report)
+
+class _Job:
+    """A queued unit of work whose output chunks can be read by several subscribers."""
+
+    def __init__(self, key: Optional[tuple], priority: int, run: Callable[["_Job"], Any], label: str):
+        self.key = key
+        self.priority = priority
+        self.run = run
+        self.label = label
+        self.chunks: List[str] = []
+        self.prepared: Any = None
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.is_prepared = False
+        self.done = False
+        self.cancelled = False
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self.enqueued_at = time.perf_counter()
+        self.context = contextvars.copy_context()
+        self._condition = threading.Condition()
+
+    # Producer side (event loop thread)
+    def set_prepared(self, value: Any):
+        with self._condition:
+            self.prepared, self.is_prepared = value, True
+            self._condition.notify_all()
+
+    def publish(self, chunk: str):
+        with self._condition:
+            self.chunks.append(chunk)
+            self._condition.notify_all()
+
+    def finish(self, result: Any = None, error: Optional[BaseException] = None):
+        with self._condition:
+            self.result, self.error = result, error
+            self.is_prepared = self.done = True
+            self._condition.notify_all()
+
+    # Consumer side (Streamlit script threads)
+    def wait(self, predicate: Callable[[], bool], timeout: Optional[float]) -> bool:
+        with self._condition:
+            return self._condition.wait_for(predicate, timeout)
+
+class StreamHandle:
+    """
+    One subscriber's view of a (possibly shared) job. Iterating `tokens()` blocks the
+    calling thread only; closing the iteration early releases the subscription.
+    """
+
+    def __init__(self, service: "AnswerService", job: _Job):
+        self._service = service
+        self.job = job
+        self._released = False
+
+    def prepared(self, timeout: Optional[float] = None) -> Any:
+        """Waits for the retrieval step and returns its result (None if nothing was found)."""
+        self.job.wait(lambda: self.job.is_prepared, timeout)
+        if isinstance(self.job.error, asyncio.CancelledError):
+            return None
+        if self.job.error is not None and not self.job.chunks:
+            raise self.job.error
+        return self.job.prepared
+
+    def tokens(self) -> Iterator[str]:
+        """Yields the generated chunks as they arrive, starting from the first one."""
+        position = 0
+        try:
+            while True:
+                self.job.wait(lambda: len(self.job.chunks) > position or self.job.done, timeout=1.0)
+                while position < len(self.job.chunks):
+                    position += 1
+                    yield self.job.chunks[position - 1]
+                if self.job.done:
+                    if self.job.error is not None and not isinstance(self.job.error, asyncio.CancelledError):
+                        raise self.job.error
+                    return
+        finally:
+            self.cancel()
+
+    def result(self, timeout: Optional[float] = None) -> Any:
+        self.job.wait(lambda: self.job.done, timeout)
+        if self.job.error is not None:
+            raise self.job.error
+        return self.job.result
+
+    def cancel(self):
+        """Releases this subscription; the job is cancelled once nobody else is reading it."""
+        if not self._released:
+            self._released = True
+            self._service._release(self.job)
+
+class AnswerService:
+    """Runs questions, narratives and ingests on a shared event loop with bounded concurrency."""
+
+    def __init__(self, workers: int = 4, queue_size: int = 64, bulk_concurrency: int = 1,
+                 model_concurrency: Optional[Dict[str, int]] = None, default_model_concurrency: int = 2):
+        self.workers = max(1, workers)
+        self.queue_size = queue_size
+        self.bulk_concurrency = max(1, min(bulk_concurrency, self.workers))
+        self.model_concurrency = model_concurrency or {}
+        self.default_model_concurrency = default_model_concurrency
+        self._lock = threading.Lock()
+        self._in_flight: Dict[tuple, _Job] = {}
+        self._session_handles: Dict[str, StreamHandle] = {}
+        self._sequence = itertools.count()
+        self._bulk_executor = ThreadPoolExecutor(max_workers=self.bulk_concurrency, thread_name_prefix="bulk")
+        self._loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run_loop, name="answer-service", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._queue: asyncio.PriorityQueue = asyncio.PriorityQueue(maxsize=self.queue_size)
+        self._bulk_slots = asyncio.Semaphore(self.bulk_concurrency)
+        self._model_slots: Dict[str, asyncio.Semaphore] = {}
+        for i in range(self.workers):
+            self._loop.create_task(self._worker(i))
+        self._ready.set()
+        self._loop.run_forever()
+
+    def _model_slot(self, model: str) -> asyncio.Semaphore:
+        if model not in self._model_slots:
+            limit = self.model_concurrency.get(model, self.default_model_concurrency)
+            self._model_slots[model] = asyncio.Semaphore(max(1, limit))
+        return self._model_slots[model]
+
+    async def _worker(self, index: int):
+        while True:
+            _, _, job = await self._queue.get()
+            try:
+                if job.cancelled:
+                    job.finish(error=asyncio.CancelledError())
+                    if job.priority == BULK:
+                        self._bulk_slots.release()
+                    continue
+                logging.debug(f"Worker {index} starts {job.label} after {time.perf_counter() - job.enqueued_at:.3f}s in queue.")
+                # The job runs in its submitter's context, so its spans land in the submitter's trace
+                job.task = self._loop.create_task(self._execute(job), context=job.context)
+                # Waiting (rather than awaiting) keeps the worker alive when the job is cancelled
+                await asyncio.wait([job.task])
+            finally:
+                self._queue.task_done()
+
+    async def _execute(self, job: _Job):
+        try:
+            job.finish(result=await job.run(job))
+        except asyncio.CancelledError as e:
+            job.finish(error=e)
+            raise
+        except Exception as e:
+            logging.error(f"{job.label} failed: {e}")
+            job.finish(error=e)
+        finally:
+            with self._lock:
+                if job.key is not None and self._in_flight.get(job.key) is job:
+                    del self._in_flight[job.key]
+            if job.priority == BULK:
+                self._bulk_slots.release()
+
+    def _enqueue(self, job: _Job):
+        """Adds a job to the priority queue (event loop thread)."""
+        try:
+            self._queue.put_nowait((job.priority, next(self._sequence), job))
+        except asyncio.QueueFull:
+            job.finish(error=QueueFullError("The assistant is busy, please try again in a moment."))
+            with self._lock:
+                if job.key is not None and self._in_flight.get(job.key) is job:
+                    del self._in_flight[job.key]
+            if job.priority == BULK:
+                self._bulk_slots.release()
+
+    async def _enqueue_bulk(self, job: _Job):
+        # Bulk jobs wait for a bulk slot before entering the queue, so ingests can never
+        # occupy every worker and interactive questions always find one
+        await self._bulk_slots.acquire()
+        if job.cancelled:
+            self._bulk_slots.release()
+            job.finish(error=asyncio.CancelledError())
+            return
+        self._enqueue(job)
+
+    def _submit(self, job: _Job) -> _Job:
+        """Registers a new job, or returns the identical one already in flight."""
+        with self._lock:
+            if job.key is not None:
+                existing = self._in_flight.get(job.key)
+                if existing is not None and not existing.cancelled:
+                    existing.subscribers += 1
+                    logging.info(f"Coalesced {job.label} with an identical request in flight.")
+                    return existing
+                self._in_flight[job.key] = job
+            if self._queue.qsize() >= self.queue_size:
+                self._in_flight.pop(job.key, None)
+                raise QueueFullError("The assistant is busy, please try again in a moment.")
+            job.subscribers += 1
+        if job.priority == BULK:
+            asyncio.run_coroutine_threadsafe(self._enqueue_bulk(job), self._loop)
+        else:
+            self._loop.call_soon_threadsafe(self._enqueue, job)
+        return job
+
+    def _release(self, job: _Job):
+        with self._lock:
+            job.subscribers -= 1
+            if job.subscribers > 0 or job.done:
+                return
+            job.cancelled = True
+            if job.key is not None and self._in_flight.get(job.key) is job:
+                del self._in_flight[job.key]
+        logging.info(f"Cancelling {job.label}: no one is waiting for it.")
+        self._loop.call_soon_threadsafe(lambda: job.task.cancel() if job.task else None)
+
+    def _track_session(self, session_id: Optional[str], handle: StreamHandle):
+        if session_id is None:
+            return
+        with self._lock:
+            previous = self._session_handles.get(session_id)
+            self._session_handles[session_id] = handle
+        if previous is not None and previous.job is not handle.job:
+            previous.cancel()
+
+    def cancel_session(self, session_id: str, unless_question: Optional[str] = None):
+        """Cancels the session's current question, unless it is the given (unchanged) question."""
+        with self._lock:
+            handle = self._session_handles.get(session_id)
+            if handle is None:
+                return
+            if unless_question is not None and handle.job.key and normalize_question(unless_question) in handle.job.key:
+                return
+            del self._session_handles[session_id]
+        handle.cancel()
+
+    async def _generate(self, job: _Job, context: str, prompt: str, language: str, model: str):
+        from llm_interface import acall_llm
+
+        async with self._model_slot(model):
+            async for chunk in acall_llm(context, prompt, language):
+                job.publish(chunk)
+
+    def submit_question(self, question: str, property_id: str, n_results: int, language: str,
+                        model: str, dataset_version: str, session_id: Optional[str] = None,
+                        profile: bool = False) -> StreamHandle:
+        """
+        Queues a retrieval-augmented answer at interactive priority. Identical questions
+        (same normalized text, property, dataset version, model, language and n_results)
+        in flight share one job. Raises QueueFullError when the queue is full.
+        With `profile`, the retrieval step is profiled into the submitter's trace.
+        """
+        def prepare() -> Optional[PreparedAnswer]:
+            from telemetry import current_trace, profile_request
+
+            # Profiled on the thread doing the work; generation only awaits Ollama on the event loop
+            with profile_request(current_trace(), profile):
+                return prepare_answer(question, property_id, n_results, model)
+
+        async def run(job: _Job):
+            prepared = await asyncio.to_thread(prepare)
+            job.set_prepared(prepared)
+            if prepared is not None:
+                await self._generate(job, prepared.context, question, language, model)
+
+        key = ("question", normalize_question(question), property_id, n_results, language, model, dataset_version)
+        handle = StreamHandle(self, self._submit(_Job(key, INTERACTIVE, run, f"question '{question[:60]}'")))
+        self._track_session(session_id, handle)
+        return handle
+
+    def submit_generation(self, context: str, prompt: str, language: str, model: str,
+                          session_id: Optional[str] = None) -> StreamHandle:
+        """Queues a plain LLM generation (e.g. a narrative) at interactive priority."""
+        async def run(job: _Job):
+            job.set_prepared(True)
+            await self._generate(job, context, prompt, language, model)
+
+        key = ("generation", context, prompt, language, model)
+        handle = StreamHandle(self, self._submit(_Job(key, INTERACTIVE, run, "narrative")))
+        self._track_session(session_id, handle)
+        return handle
+
+    def submit_ingest(self, fn: Callable[..., Any], *args, **kwargs) -> StreamHandle:
+        """Queues a blocking ingest at bulk priority; it runs on a dedicated bulk thread."""
+        async def run(job: _Job):
+            # Executor threads don't inherit context variables; carry the submitter's trace over
+            context = contextvars.copy_context()
+            return await self._loop.run_in_executor(self._bulk_executor, lambda: context.run(fn, *args, **kwargs))
+
+        return StreamHandle(self, self._submit(_Job(None, BULK, run, "ingest")))
+
+    def shutdown(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self._bulk_executor.shutdown(wait=False)
+
+_service: Optional[AnswerService] = None
+_service_lock = threading.Lock()
+
+def get_answer_service() -> AnswerService:
+    """Returns the process-wide service shared by every Streamlit session."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = AnswerService(
+                workers=config.get("service_workers", 4),
+                queue_size=config.get("service_queue_size", 64),
+                bulk_concurrency=config.get("bulk_concurrency", 1),
+                model_concurrency=config.get("model_concurrency", {}),
+                default_model_concurrency=config.get("ollama_concurrency", 2),
+            )
+        return _service
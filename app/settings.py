@@ -0,0 +1,8 @@
+import yaml
+
+def load_config(path: str = "config.yaml") -> dict:
+    with open(path, "r") as f:
+        return yaml.safe_load(f) or {}
+
+# Read once per process and shared by every module
+config = load_config()
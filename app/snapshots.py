@@ -0,0 +1,189 @@
+import os
+import logging
+from dataclasses import dataclass
+from datetime import date, datetime
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from manifest import DEFAULT_PROPERTY
+from rate_store import OWN_RATE_COLUMN, RESTRICTION_COLUMNS, competitor_columns, load_rate_table
+from settings import config
+
+SNAPSHOT_STORE_PATH = config.get("snapshot_store_path", "./snapshots")
+
+# Alert types
+COMPETITOR_MOVE = "Competitor move"
+UNDERCUT = "Undercut"
+RESTRICTION_CHANGE = "Restriction change"
+
+ALERT_COLUMNS = ["Date", "Alert", "Column", "Previous", "Current", "Change", "Change %", OWN_RATE_COLUMN]
+# Alerts across a property's files also name the file whose shop changed
+RATE_ALERT_COLUMNS = ["File", *ALERT_COLUMNS]
+
+@dataclass
+class AlertThresholds:
+    """When a change between two rate shops becomes an alert."""
+    # A competitor rate moving by at least this many percent and this many currency units
+    move_pct: float = 10.0
+    move_abs: float = 0.0
+    # A competitor newly pricing more than this many percent below the own rate
+    undercut_margin_pct: float = 0.0
+
+def default_thresholds() -> AlertThresholds:
+    """Returns the thresholds of config `alert_thresholds` ({move_pct, move_abs, undercut_margin_pct})."""
+    return AlertThresholds(**config.get("alert_thresholds", {}))
+
+def _safe_name(name: str) -> str:
+    return name.replace(os.sep, "_").replace("/", "_")
+
+def _property_path(property_id: str) -> str:
+    return os.path.join(SNAPSHOT_STORE_PATH, _safe_name(property_id))
+
+def _snapshot_file(path: str) -> str:
+    # Snapshot files are named <time>-<file>.parquet
+    return os.path.basename(path).split("-", 1)[1][:-len(".parquet")]
+
+def record_snapshot(table: pd.DataFrame, file_name: str, property_id: str = DEFAULT_PROPERTY,
+                    shop_date: Optional[date] = None) -> str:
+    """
+    Appends a rate table to the property's snapshot store as the shop of `shop_date` (today by
+    default) and returns its path. Snapshots are never rewritten; the store is partitioned by
+    shop date (`<property>/shop_date=YYYY-MM-DD/<time>-<file>.parquet`).
+    """
+    shop_date = shop_date or date.today()
+    directory = os.path.join(_property_path(property_id), f"shop_date={shop_date.isoformat()}")
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{datetime.now().strftime('%H%M%S%f')}-{_safe_name(file_name)}.parquet")
+    table.to_parquet(f"{path}.tmp", compression="zstd")
+    os.replace(f"{path}.tmp", path)
+    return path
+
+def list_snapshots(property_id: str = DEFAULT_PROPERTY, file_name: Optional[str] = None) -> List[Tuple[date, str]]:
+    """Returns the property's (shop date, path) snapshots, oldest first, optionally of one file only."""
+    root = _property_path(property_id)
+    if not os.path.isdir(root):
+        return []
+    snapshots = []
+    for partition in sorted(os.listdir(root)):
+        if not partition.startswith("shop_date="):
+            continue
+        shop_date = date.fromisoformat(partition.split("=", 1)[1])
+        snapshots.extend(
+            (shop_date, os.path.join(root, partition, name))
+            for name in sorted(os.listdir(os.path.join(root, partition)))
+            if name.endswith(".parquet") and (file_name is None or _snapshot_file(name) == _safe_name(file_name))
+        )
+    return snapshots
+
+def has_snapshot(file_name: str, property_id: str = DEFAULT_PROPERTY, shop_date: Optional[date] = None) -> bool:
+    """Whether the file's rate shop of `shop_date` (today by default) was already recorded."""
+    shop_date = shop_date or date.today()
+    return any(snapshot_date == shop_date for snapshot_date, _ in list_snapshots(property_id, file_name))
+
+@lru_cache(maxsize=64)
+def load_snapshot(path: str) -> pd.DataFrame:
+    """Loads one snapshot; they are immutable, so the path alone is the cache key."""
+    return pd.read_parquet(path)
+
+def _events(kind: str, dates: pd.DatetimeIndex, columns: List[str], mask: np.ndarray,
+            previous: np.ndarray, current: np.ndarray, own_rate: np.ndarray) -> pd.DataFrame:
+    rows, cols = np.nonzero(mask)
+    return pd.DataFrame({
+        "Date": dates[rows],
+        "Alert": kind,
+        "Column": np.asarray(columns, dtype=object)[cols],
+        "Previous": previous[rows, cols],
+        "Current": current[rows, cols],
+        OWN_RATE_COLUMN: own_rate[rows],
+    })
+
+def diff_snapshots(current: pd.DataFrame, previous: pd.DataFrame,
+                   thresholds: Optional[AlertThresholds] = None) -> pd.DataFrame:
+    """
+    Compares two rate shops over the stay dates and columns they share, vectorized across all
+    dates and competitors at once. Returns one row per alert: competitor moves beyond the
+    thresholds, competitors newly undercutting the own rate, and changed restrictions.
+    """
+    thresholds = thresholds or default_thresholds()
+    dates = current.index.intersection(previous.index)
+    comps = [col for col in competitor_columns(current) if col in previous.columns]
+    restrictions = [col for col in RESTRICTION_COLUMNS if col in current.columns and col in previous.columns]
+
+    own_now = current.loc[dates, OWN_RATE_COLUMN].to_numpy(dtype="float64")
+    own_before = previous.loc[dates, OWN_RATE_COLUMN].to_numpy(dtype="float64")
+    rates_now = current.loc[dates, comps].to_numpy(dtype="float64")
+    rates_before = previous.loc[dates, comps].to_numpy(dtype="float64")
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        change = rates_now - rates_before
+        change_pct = np.abs(change / rates_before) * 100
+        undercut_factor = 1 - thresholds.undercut_margin_pct / 100
+        # NaN (not shopped / sold out) compares False, so it never triggers a move
+        moved = (change != 0) & (change_pct >= thresholds.move_pct) & (np.abs(change) >= thresholds.move_abs)
+        undercut_now = rates_now < (own_now * undercut_factor)[:, None]
+        undercut_before = rates_before < (own_before * undercut_factor)[:, None]
+
+    restrictions_now = current.loc[dates, restrictions].to_numpy(dtype="float64")
+    restrictions_before = previous.loc[dates, restrictions].to_numpy(dtype="float64")
+    restriction_changed = (restrictions_now != restrictions_before) & ~(
+        np.isnan(restrictions_now) & np.isnan(restrictions_before)
+    )
+
+    alerts = pd.concat([
+        _events(COMPETITOR_MOVE, dates, comps, moved, rates_before, rates_now, own_now),
+        _events(UNDERCUT, dates, comps, undercut_now & ~undercut_before, rates_before, rates_now, own_now),
+        _events(RESTRICTION_CHANGE, dates, restrictions, restriction_changed, restrictions_before, restrictions_now, own_now),
+    ], ignore_index=True)
+    alerts["Change"] = alerts["Current"] - alerts["Previous"]
+    alerts["Change %"] = (alerts["Change"] / alerts["Previous"] * 100).round(1)
+    return alerts[ALERT_COLUMNS].sort_values(["Date", "Alert", "Column"], kind="stable", ignore_index=True)
+
+def _baseline(snapshots: List[Tuple[date, str]], shop_date: date) -> Optional[str]:
+    earlier = [path for snapshot_date, path in snapshots if snapshot_date < shop_date]
+    return earlier[-1] if earlier else None
+
+def rate_alerts(property_id: str = DEFAULT_PROPERTY, thresholds: Optional[AlertThresholds] = None) -> pd.DataFrame:
+    """
+    Alerts of the property's latest rate shop day ("today vs yesterday"): the latest shop of
+    each file shopped that day against the same file's last shop of an earlier day. Files cover
+    different room types or comp sets, so they are never compared with each other.
+    Empty if no file has an earlier shop to compare with.
+    """
+    snapshots = list_snapshots(property_id)
+    if not snapshots:
+        return pd.DataFrame(columns=RATE_ALERT_COLUMNS)
+    shop_date = snapshots[-1][0]
+    latest_by_file = {_snapshot_file(path): path for snapshot_date, path in snapshots if snapshot_date == shop_date}
+    alerts = []
+    for file_name, latest in sorted(latest_by_file.items()):
+        file_snapshots = [snapshot for snapshot in snapshots if _snapshot_file(snapshot[1]) == file_name]
+        baseline = _baseline(file_snapshots, shop_date)
+        if baseline is not None:
+            file_alerts = diff_snapshots(load_snapshot(latest), load_snapshot(baseline), thresholds)
+            alerts.append(file_alerts.assign(File=file_name)[RATE_ALERT_COLUMNS])
+    if not alerts:
+        return pd.DataFrame(columns=RATE_ALERT_COLUMNS)
+    return pd.concat(alerts, ignore_index=True)
+
+def record_rate_shop(file_name: str, property_id: str = DEFAULT_PROPERTY, shop_date: Optional[date] = None,
+                     thresholds: Optional[AlertThresholds] = None) -> Optional[pd.DataFrame]:
+    """
+    Snapshots a file's freshly stored rate table and diffs it against the file's shop of the
+    previous day. Returns the alerts (empty for the file's first shop), or None if the file has
+    no rate table.
+    """
+    table = load_rate_table(file_name, property_id)
+    if table is None:
+        return None
+    shop_date = shop_date or date.today()
+    baseline = _baseline(list_snapshots(property_id, file_name), shop_date)
+    record_snapshot(table, file_name, property_id, shop_date)
+    if baseline is None:
+        logging.info(f"First rate shop of '{file_name}' for property '{property_id}' recorded; nothing to compare with yet.")
+        return pd.DataFrame(columns=ALERT_COLUMNS)
+    alerts = diff_snapshots(table, load_snapshot(baseline), thresholds)
+    logging.info(f"Rate shop '{file_name}' of property '{property_id}': {len(alerts)} alerts against {baseline}.")
+    return alerts
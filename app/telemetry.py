@@ -0,0 +1,288 @@
+import io
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field, asdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Deque, Dict, Iterable, Iterator, List, Optional, TypeVar
+
+from settings import config
+
+# Spans kept per trace for the waterfall; stage metrics still count every span
+MAX_SPANS_PER_TRACE = config.get("telemetry_max_spans", 200)
+PROFILE_DIR = config.get("profile_dir")
+# Upper bounds (seconds) of the Prometheus latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+@dataclass
+class Span:
+    """One timed pipeline stage; `start` is seconds since the trace started."""
+    name: str
+    start: float
+    duration: float
+    counts: Dict[str, int] = field(default_factory=dict)
+
+@dataclass
+class Trace:
+    """The spans of one request (a question or an upload), in the order they finished."""
+    name: str
+    trace_id: str = field(default_factory=lambda: uuid.uuid4().hex[:12])
+    started_at: float = field(default_factory=time.time)
+    duration: float = 0.0
+    spans: List[Span] = field(default_factory=list)
+    dropped_spans: int = 0
+    # Total seconds per stage, including spans dropped from the waterfall
+    stage_seconds: Dict[str, float] = field(default_factory=dict)
+    profile: Optional[str] = None
+    _started: float = field(default_factory=time.perf_counter, repr=False)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "started_at": round(self.started_at, 3),
+            "duration": round(self.duration, 6),
+            "dropped_spans": self.dropped_spans,
+            "stage_seconds": {name: round(seconds, 6) for name, seconds in self.stage_seconds.items()},
+            "spans": [
+                {**asdict(span), "start": round(span.start, 6), "duration": round(span.duration, 6)}
+                for span in self.spans
+            ],
+        }
+
+@dataclass
+class _StageStats:
+    count: int = 0
+    total_seconds: float = 0.0
+    buckets: List[int] = field(default_factory=lambda: [0] * len(LATENCY_BUCKETS))
+    counts: Dict[str, int] = field(default_factory=dict)
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+_metrics_lock = threading.Lock()
+_stage_stats: Dict[str, _StageStats] = {}
+_trace_counts: Dict[str, int] = {}
+# Most recent finished traces, newest last
+recent_traces: Deque[Trace] = deque(maxlen=50)
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+def _observe(name: str, duration: float, counts: Dict[str, int]):
+    with _metrics_lock:
+        stats = _stage_stats.setdefault(name, _StageStats())
+        stats.count += 1
+        stats.total_seconds += duration
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if duration <= bound:
+                stats.buckets[i] += 1
+        for key, value in counts.items():
+            stats.counts[key] = stats.counts.get(key, 0) + int(value)
+
+def record_span(name: str, duration: float, started: Optional[float] = None, **counts: int) -> Span:
+    """
+    Records a stage that was timed elsewhere. `started` is a `time.perf_counter()` value;
+    it defaults to `duration` seconds ago. Counts (rows, chunks, tokens...) are summed per stage.
+    """
+    counts = {key: int(value) for key, value in counts.items() if value is not None}
+    _observe(name, duration, counts)
+    trace = _current_trace.get()
+    if started is None:
+        started = time.perf_counter() - duration
+    span = Span(name, started - trace._started if trace else 0.0, duration, counts)
+    if trace is None:
+        logging.debug("Span: " + json.dumps(asdict(span)))
+        return span
+    trace.stage_seconds[name] = trace.stage_seconds.get(name, 0.0) + duration
+    if len(trace.spans) < MAX_SPANS_PER_TRACE:
+        trace.spans.append(span)
+    else:
+        trace.dropped_spans += 1
+    return span
+
+@contextmanager
+def span(name: str, **counts: int) -> Iterator[Dict[str, int]]:
+    """
+    Times a pipeline stage in the current trace. Yields the span's counts so the stage can
+    add what it processed once known, e.g. `counts["rows"] = len(df)`.
+    """
+    counts = dict(counts)
+    started = time.perf_counter()
+    try:
+        yield counts
+    finally:
+        record_span(name, time.perf_counter() - started, started, **counts)
+
+T = TypeVar("T")
+
+def timed_iter(name: str, items: Iterable[T], counts: Optional[Callable[[T], Dict[str, int]]] = None) -> Iterator[T]:
+    """
+    Records the time spent waiting for each item of a lazy iterable (file batches, embedding
+    results) as a span; `counts(item)` returns the counts to attach to it.
+    """
+    iterator = iter(items)
+    while True:
+        started = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        record_span(name, time.perf_counter() - started, started, **(counts(item) if counts else {}))
+        yield item
+
+@contextmanager
+def start_trace(name: str) -> Iterator[Trace]:
+    """
+    Collects the spans of one request. Non-empty traces are logged as one JSON line and
+    kept in `recent_traces` for the debug panel.
+    """
+    trace = Trace(name)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+        trace.duration = time.perf_counter() - trace._started
+        if trace.spans or trace.dropped_spans:
+            recent_traces.append(trace)
+            with _metrics_lock:
+                _trace_counts[trace.name] = _trace_counts.get(trace.name, 0) + 1
+            logging.info("Trace: " + json.dumps(trace.to_dict()))
+
+@contextmanager
+def profile_request(trace: Optional[Trace], enabled: bool = True) -> Iterator[None]:
+    """
+    Profiles the enclosed code with pyinstrument (config `profiler: pyinstrument`) or
+    cProfile and attaches the text report to the trace. Reports are also written to
+    `profile_dir` if configured. Both profilers only see the calling thread, so work handed
+    to a worker thread is profiled there; each report is added to the trace under its thread.
+    """
+    if not enabled:
+        yield
+        return
+
+    profiler_name = config.get("profiler", "cprofile")
+    if profiler_name == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            logging.warning("pyinstrument is not installed; falling back to cProfile.")
+            profiler_name = "cprofile"
+
+    if profiler_name == "pyinstrument":
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            report = profiler.output_text(unicode=False, color=False)
+    else:
+        import cProfile
+        import pstats
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as e:
+            # From Python 3.12 only one cProfile can be active per process at a time
+            logging.warning(f"Not profiling thread '{threading.current_thread().name}': {e}")
+            yield
+            return
+        try:
+            yield
+        finally:
+            profiler.disable()
+            output = io.StringIO()
+            pstats.Stats(profiler, stream=output).sort_stats("cumulative").print_stats(40)
+            report = output.getvalue()
+
+    report = f"Thread '{threading.current_thread().name}'\n{report}"
+    if trace is not None:
+        trace.profile = f"{trace.profile}\n\n{report}" if trace.profile else report
+    if PROFILE_DIR:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        name = trace.trace_id if trace else time.strftime("%Y%m%d-%H%M%S")
+        with open(os.path.join(PROFILE_DIR, f"{name}.{profiler_name}.txt"), "a") as f:
+            f.write(f"{report}\n\n")
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def render_prometheus() -> str:
+    """Renders stage latency histograms, stage counters and request counts in Prometheus text format."""
+    with _metrics_lock:
+        stages = {name: (stats.count, stats.total_seconds, list(stats.buckets), dict(stats.counts))
+                  for name, stats in _stage_stats.items()}
+        traces = dict(_trace_counts)
+
+    lines = [
+        "# HELP revenue_assistant_stage_seconds Time spent per pipeline stage.",
+        "# TYPE revenue_assistant_stage_seconds histogram",
+    ]
+    for name, (count, total, buckets, _) in sorted(stages.items()):
+        stage = _label(name)
+        for bound, bucket_count in zip(LATENCY_BUCKETS, buckets):
+            lines.append(f'revenue_assistant_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {bucket_count}')
+        lines.append(f'revenue_assistant_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {count}')
+        lines.append(f'revenue_assistant_stage_seconds_sum{{stage="{stage}"}} {total:.6f}')
+        lines.append(f'revenue_assistant_stage_seconds_count{{stage="{stage}"}} {count}')
+
+    lines += [
+        "# HELP revenue_assistant_stage_items_total Items processed per pipeline stage (rows, chunks, tokens).",
+        "# TYPE revenue_assistant_stage_items_total counter",
+    ]
+    for name, (_, _, _, counts) in sorted(stages.items()):
+        for item, value in sorted(counts.items()):
+            lines.append(f'revenue_assistant_stage_items_total{{stage="{_label(name)}",item="{_label(item)}"}} {value}')
+
+    lines += [
+        "# HELP revenue_assistant_requests_total Traced requests by type.",
+        "# TYPE revenue_assistant_requests_total counter",
+    ]
+    for name, count in sorted(traces.items()):
+        lines.append(f'revenue_assistant_requests_total{{request="{_label(name)}"}} {count}')
+    return "\n".join(lines) + "\n"
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+_metrics_server: Optional[ThreadingHTTPServer] = None
+_server_lock = threading.Lock()
+
+def start_metrics_server(port: Optional[int] = None, host: Optional[str] = None) -> Optional[ThreadingHTTPServer]:
+    """
+    Serves `render_prometheus()` at /metrics in a background thread (config `metrics_port`,
+    disabled when unset). Safe to call on every Streamlit rerun; the server starts once.
+    """
+    global _metrics_server
+    port = port or config.get("metrics_port")
+    if not port:
+        return None
+    with _server_lock:
+        if _metrics_server is None:
+            try:
+                _metrics_server = ThreadingHTTPServer((host or config.get("metrics_host", "127.0.0.1"), int(port)), _MetricsHandler)
+            except OSError as e:
+                logging.error(f"Metrics endpoint could not be started on port {port}: {e}")
+                return None
+            threading.Thread(target=_metrics_server.serve_forever, name="metrics", daemon=True).start()
+            logging.info(f"Serving Prometheus metrics on port {port} at /metrics.")
+        return _metrics_server
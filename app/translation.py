@@ -0,0 +1,134 @@
+import re
+import asyncio
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import AsyncGenerator, AsyncIterable, Dict, Generator, Iterable, List, Tuple, Type
+
+from settings import config
+from telemetry import span
+
+LANGUAGE_NAMES = {
+    "en": "English",
+    "de": "German",
+    "es": "Spanish",
+    "fr": "French",
+    "it": "Italian",
+    "pt": "Portuguese",
+    "nl": "Dutch",
+}
+
+# A sentence ends at ., ! or ? followed by whitespace, or at a line break
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n+")
+
+def language_name(language: str) -> str:
+    return LANGUAGE_NAMES.get(language, language)
+
+class TranslationBackend(ABC):
+    """
+    Translates model output into the user's language. Backends that translate the
+    stream set `translates_stream`; others instead add an instruction to the system
+    prompt so the model answers natively.
+    """
+    name = "base"
+    translates_stream = True
+
+    def system_instruction(self, language: str) -> str:
+        return ""
+
+    @abstractmethod
+    def translate(self, text: str, language: str) -> str:
+        """Translates a sentence or phrase into `language`."""
+
+class OllamaTranslationBackend(TranslationBackend):
+    """Translates with a local Ollama model, so no text leaves the network."""
+    name = "ollama"
+
+    def __init__(self):
+        self.model = config.get("translation_model", config["llm_model"])
+
+    def translate(self, text: str, language: str) -> str:
+        import ollama
+
+        response = ollama.chat(
+            model=self.model,
+            stream=False,
+            keep_alive=config.get("ollama_keep_alive"),
+            messages=[
+                {
+                    "role": "system",
+                    "content": (
+                        f"Translate the user's text into {language_name(language)}. "
+                        "Keep numbers, dates, hotel and competitor names, and Markdown formatting unchanged. "
+                        "Reply with the translation only."
+                    ),
+                },
+                {"role": "user", "content": text},
+            ],
+        )
+        return response["message"]["content"].strip()
+
+class NativeLanguageBackend(OllamaTranslationBackend):
+    """Has the model answer directly in the target language; only fixed phrases are translated."""
+    name = "native"
+    translates_stream = False
+
+    def system_instruction(self, language: str) -> str:
+        return f"\nAlways write your entire answer in {language_name(language)}.\n"
+
+class GoogleTranslationBackend(TranslationBackend):
+    """Translates through Google Translate via deep-translator; requires internet access."""
+    name = "google"
+
+    def translate(self, text: str, language: str) -> str:
+        from deep_translator import GoogleTranslator
+
+        return GoogleTranslator(source="auto", target=language).translate(text)
+
+TRANSLATION_BACKENDS: Dict[str, Type[TranslationBackend]] = {
+    backend.name: backend
+    for backend in (NativeLanguageBackend, OllamaTranslationBackend, GoogleTranslationBackend)
+}
+
+@lru_cache(maxsize=None)
+def get_translation_backend(name: str = None) -> TranslationBackend:
+    """Returns the configured translation backend (config key `translation_backend`, default 'native')."""
+    name = name or config.get("translation_backend", "native")
+    if name not in TRANSLATION_BACKENDS:
+        raise ValueError(f"Unknown translation backend '{name}'. Available: {', '.join(TRANSLATION_BACKENDS)}")
+    return TRANSLATION_BACKENDS[name]()
+
+@lru_cache(maxsize=2048)
+def translate_phrase(text: str, language: str, backend_name: str = None) -> str:
+    """Translates a sentence or fixed phrase, caching the result for repeated use."""
+    with span("translation", chars=len(text)):
+        return get_translation_backend(backend_name).translate(text, language)
+
+def _complete_sentences(buffer: str) -> Tuple[List[Tuple[str, str]], str]:
+    """Splits buffered text into complete (sentence, separator) pairs and the unfinished rest."""
+    parts = _SENTENCE_END.split(buffer)
+    return list(zip(parts[:-1], _SENTENCE_END.findall(buffer))), parts[-1]
+
+def translate_stream(chunks: Iterable[str], language: str, backend_name: str = None) -> Generator[str, None, None]:
+    """
+    Translates a token stream sentence by sentence: tokens are buffered until a sentence
+    is complete, then the translated sentence is yielded with its original separator.
+    """
+    buffer = ""
+    for chunk in chunks:
+        sentences, buffer = _complete_sentences(buffer + chunk)
+        for sentence, separator in sentences:
+            yield (translate_phrase(sentence, language, backend_name) if sentence.strip() else sentence) + separator
+    if buffer:
+        yield translate_phrase(buffer, language, backend_name) if buffer.strip() else buffer
+
+async def atranslate_stream(chunks: AsyncIterable[str], language: str, backend_name: str = None) -> AsyncGenerator[str, None]:
+    """Async `translate_stream`; translations run in a worker thread so the event loop keeps streaming."""
+    buffer = ""
+    async for chunk in chunks:
+        sentences, buffer = _complete_sentences(buffer + chunk)
+        for sentence, separator in sentences:
+            if sentence.strip():
+                sentence = await asyncio.to_thread(translate_phrase, sentence, language, backend_name)
+            yield sentence + separator
+    if buffer:
+        yield await asyncio.to_thread(translate_phrase, buffer, language, backend_name) if buffer.strip() else buffer
@@ -1,51 +1,158 @@
+import re
+import time
+import hashlib
 import logging
-from typing import List, Optional
-from langchain.schema import Document
+import threading
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional
 
-import chromadb
-from chromadb.utils.embedding_functions.ollama_embedding_function import (
-    OllamaEmbeddingFunction,
-)
 import streamlit as st
-import yaml
 
-def load_config():
-    with open("config.yaml", "r") as f:
-        return yaml.safe_load(f)
+from aggregates import delete_aggregates
+from cache import cache_query_embedding, get_cached_query_embedding, invalidate_answers
+from lexical_index import get_lexical_index
+from manifest import DEFAULT_PROPERTY, document_id, list_documents, remove_document_entry
+from rate_store import delete_rate_table
+from settings import config
+from telemetry import span, timed_iter
 
-config = load_config()
+if TYPE_CHECKING:
+    # chromadb and langchain take about a second to import; they load on first use instead
+    import chromadb
+    from langchain.schema import Document
+    from embeddings import PooledOllamaEmbeddingFunction
 
-def get_vector_collection() -> Optional[chromadb.Collection]:
-    """Gets or creates a ChromaDB collection for vector storage."""
-    try:
-        ollama_ef = OllamaEmbeddingFunction(
+HEALTH_CHECK_INTERVAL = config.get("vector_store_health_check_interval", 30)
+EMBEDDING_BATCH_SIZE = config.get("embedding_batch_size", 32)
+EMBEDDING_CONCURRENCY = config.get("embedding_concurrency", 4)
+EMBEDDING_MAX_RETRIES = config.get("embedding_max_retries", 3)
+
+# Process-wide handles shared by every Streamlit session and thread, one collection per property
+_collection_lock = threading.Lock()
+_embedding_function: Optional["PooledOllamaEmbeddingFunction"] = None
+_chroma_client = None
+_collections: Dict[str, "chromadb.Collection"] = {}
+_last_health_checks: Dict[str, float] = {}
+
+def get_embedding_function() -> "PooledOllamaEmbeddingFunction":
+    """Returns the shared, connection-pooled Ollama embedding function."""
+    global _embedding_function
+    if _embedding_function is None:
+        from embeddings import PooledOllamaEmbeddingFunction
+
+        _embedding_function = PooledOllamaEmbeddingFunction(
             url=config["ollama_url"],
             model_name=config["embedding_model"],
+            pool_size=config.get("embedding_pool_size", 10),
+            keep_alive=config.get("ollama_keep_alive"),
         )
+    return _embedding_function
 
-        chroma_client = chromadb.PersistentClient(path=config["vector_store_path"])
-        collection = chroma_client.get_or_create_collection(
-            name="revenue_optimization",
-            embedding_function=ollama_ef,
-            metadata={"hnsw:space": "cosine"},
-        )
-        return collection
+def _property_slug(property_id: str) -> str:
+    # Chroma names allow 3-63 characters from [a-zA-Z0-9._-]
+    return re.sub(r"[^a-zA-Z0-9_-]+", "-", property_id).strip("-_") or "property"
+
+def collection_name(property_id: str = DEFAULT_PROPERTY) -> str:
+    """Returns the Chroma collection name of a property's namespace."""
+    if property_id == DEFAULT_PROPERTY:
+        return "revenue_optimization"
+    # The slug alone can collide ("Hotel A" / "Hotel-A", long shared prefixes); the hash keeps names unique
+    digest = hashlib.sha1(property_id.encode()).hexdigest()[:8]
+    return f"revenue_optimization_{_property_slug(property_id)[:30]}-{digest}"
+
+def _legacy_collection_name(property_id: str) -> str:
+    # Name used before collection names carried a hash; possibly shared by several properties
+    return f"revenue_optimization_{_property_slug(property_id)[:40]}"
+
+def _migrate_legacy_collection(client, collection: "chromadb.Collection", property_id: str, page_size: int = 1000):
+    """Copies a property's own rows from its old, possibly shared, collection into a new empty one."""
+    legacy_name = _legacy_collection_name(property_id)
+    if property_id == DEFAULT_PROPERTY or collection.count() > 0:
+        return
+    if legacy_name not in {existing.name for existing in client.list_collections()}:
+        return
+    legacy = client.get_collection(legacy_name, embedding_function=get_embedding_function())
+    where = {"property_id": property_id}
+    copied = 0
+    while True:
+        page = legacy.get(where=where, include=["documents", "metadatas", "embeddings"], limit=page_size, offset=copied)
+        if not page["ids"]:
+            break
+        collection.upsert(ids=page["ids"], documents=page["documents"], metadatas=page["metadatas"],
+                          embeddings=page["embeddings"])
+        copied += len(page["ids"])
+    if copied:
+        logging.info(f"Copied {copied} rows of property '{property_id}' from collection '{legacy_name}' to '{collection.name}'.")
+
+def _collection_is_healthy(collection: "chromadb.Collection") -> bool:
+    try:
+        collection.count()
+        return True
+    except Exception as e:
+        logging.warning(f"Vector collection health check failed, reconnecting: {e}")
+        return False
+
+def reset_vector_collection():
+    """Drops the cached client and collection handles so the next access reconnects."""
+    global _chroma_client
+    with _collection_lock:
+        _chroma_client = None
+        _collections.clear()
+
+def get_vector_collection(property_id: str = DEFAULT_PROPERTY) -> Optional["chromadb.Collection"]:
+    """Gets or creates a property's ChromaDB collection, reconnecting lazily if it became unhealthy."""
+    global _chroma_client
+    try:
+        with _collection_lock:
+            now = time.monotonic()
+            collection = _collections.get(property_id)
+            if collection is not None and now - _last_health_checks.get(property_id, 0.0) >= HEALTH_CHECK_INTERVAL:
+                if not _collection_is_healthy(collection):
+                    _chroma_client = None
+                    _collections.clear()
+                    collection = None
+                _last_health_checks[property_id] = now
+            if collection is None:
+                if _chroma_client is None:
+                    import chromadb
+
+                    _chroma_client = chromadb.PersistentClient(path=config["vector_store_path"])
+                collection = _chroma_client.get_or_create_collection(
+                    name=collection_name(property_id),
+                    embedding_function=get_embedding_function(),
+                    metadata={"hnsw:space": "cosine"},
+                )
+                _migrate_legacy_collection(_chroma_client, collection, property_id)
+                _collections[property_id] = collection
+                _last_health_checks[property_id] = now
+            return collection
     except Exception as e:
         logging.error(f"An error occurred while accessing the vector collection: {e}")
         st.error(f"An error occurred while accessing the vector collection: {e}")
         return None
 
-def add_to_vector_collection(all_splits: List[Document], file_name: str):
-    """Adds document splits to a vector collection for semantic search."""
+def add_to_vector_collection(
+    all_splits: List["Document"],
+    file_name: str,
+    property_id: str = DEFAULT_PROPERTY,
+    progress_callback: Optional[Callable[[int, Optional[int]], None]] = None,
+) -> bool:
+    """
+    Adds document splits to a vector collection for semantic search.
+
+    Splits are embedded in batches with bounded concurrency and upserted batch by batch;
+    `progress_callback(done, total)` is called after each batch. Returns True on success.
+    """
+    from embeddings import iter_embedded_batches
+
     try:
-        collection = get_vector_collection()
+        collection = get_vector_collection(property_id)
         if not collection:
             st.error("Vector store collection could not be initialized.")
-            return
+            return False
 
         if not all_splits:
             st.warning(f"No document splits found for file '{file_name}'. Skipping.")
-            return
+            return False
 
         documents, metadatas, ids = [], [], []
 
@@ -55,75 +162,190 @@ def add_to_vector_collection(all_splits: List[Document], file_name: str):
                 continue
             documents.append(split.page_content)
             metadatas.append(split.metadata)
-            ids.append(f"{file_name}_{idx}")
+            ids.append(document_id(file_name, split.metadata.get("date", str(idx))))
 
         if not documents:
             st.warning(f"No valid documents to add for file '{file_name}'.")
-            return
+            return False
 
         logging.info(f"Adding {len(documents)} documents to the vector store.")
-        collection.upsert(
-            documents=documents,
-            metadatas=metadatas,
-            ids=ids,
+        lexical_index = get_lexical_index()
+        batches = iter_embedded_batches(
+            get_embedding_function(),
+            documents,
+            batch_size=EMBEDDING_BATCH_SIZE,
+            concurrency=EMBEDDING_CONCURRENCY,
+            max_retries=EMBEDDING_MAX_RETRIES,
         )
-        st.success(f"Data from '{file_name}' added to the vector store!")
+        # Embedding spans measure the time spent waiting on the concurrent embedding requests
+        for start, end, embeddings in timed_iter("embedding", batches, lambda batch: {"chunks": batch[1] - batch[0]}):
+            with span("chroma.upsert", chunks=end - start):
+                collection.upsert(
+                    documents=documents[start:end],
+                    metadatas=metadatas[start:end],
+                    ids=ids[start:end],
+                    embeddings=embeddings,
+                )
+            if lexical_index is not None:
+                with span("lexical.upsert", chunks=end - start):
+                    lexical_index.upsert(property_id, ids[start:end], documents[start:end], metadatas[start:end])
+            if progress_callback:
+                progress_callback(end, len(documents))
+        logging.info(f"Data from '{file_name}' added to the vector store.")
+        return True
     except Exception as e:
         logging.error(f"An error occurred while adding data to the vector store: {e}")
         st.error(f"An error occurred while adding data to the vector store: {e}")
+        return False
 
-def query_collection(prompt: str, n_results: int = 10):
-    """Queries the vector collection with a given prompt to retrieve relevant documents and their distances."""
+def delete_from_vector_collection(ids: List[str], file_name: str, property_id: str = DEFAULT_PROPERTY) -> bool:
+    """Removes the vectors of rows that disappeared from a re-uploaded document. Returns True on success."""
     try:
-        collection = get_vector_collection()
+        if not ids:
+            return True
+        collection = get_vector_collection(property_id)
         if not collection:
             st.error("Vector store collection could not be initialized.")
+            return False
+        logging.info(f"Removing {len(ids)} stale documents of '{file_name}' from the vector store.")
+        collection.delete(ids=ids)
+        lexical_index = get_lexical_index()
+        if lexical_index is not None:
+            lexical_index.delete(property_id, ids)
+        return True
+    except Exception as e:
+        logging.error(f"An error occurred while removing data from the vector store: {e}")
+        st.error(f"An error occurred while removing data from the vector store: {e}")
+        return False
+
+def delete_file_vectors(file_name: str, property_id: str = DEFAULT_PROPERTY) -> bool:
+    """
+    Removes every vector of a document, whatever its ID scheme (including the old
+    `<file>_<index>` chunks written before row-level IDs). Returns True on success.
+    """
+    try:
+        collection = get_vector_collection(property_id)
+        if not collection:
+            st.error("Vector store collection could not be initialized.")
+            return False
+        collection.delete(where={"file_name": file_name})
+        lexical_index = get_lexical_index()
+        if lexical_index is not None:
+            lexical_index.delete_file(property_id, file_name)
+        return True
+    except Exception as e:
+        logging.error(f"An error occurred while removing data from the vector store: {e}")
+        st.error(f"An error occurred while removing data from the vector store: {e}")
+        return False
+
+def embed_query(prompt: str) -> List[float]:
+    """Embeds a question, reusing the cached embedding of an identical earlier question."""
+    query_embedding = get_cached_query_embedding(prompt, config["embedding_model"])
+    if query_embedding is None:
+        with span("embedding.query", chunks=1):
+            query_embedding = get_embedding_function()([prompt])[0]
+        cache_query_embedding(prompt, config["embedding_model"], query_embedding)
+    return query_embedding
+
+def get_embeddings(ids: List[str], property_id: str = DEFAULT_PROPERTY) -> Dict[str, List[float]]:
+    """Returns the stored embeddings of the given chunk IDs ({} if the collection is unavailable)."""
+    collection = get_vector_collection(property_id)
+    if not collection or not ids:
+        return {}
+    stored = collection.get(ids=ids, include=["embeddings"])
+    return dict(zip(stored["ids"], stored["embeddings"]))
+
+def sync_lexical_index(property_id: str = DEFAULT_PROPERTY, page_size: int = 5000):
+    """
+    Fills the lexical index from the property's Chroma collection if it is missing chunks,
+    e.g. for collections ingested before the index existed. Cheap when already in sync.
+    """
+    collection = get_vector_collection(property_id)
+    lexical_index = get_lexical_index()
+    if not collection or lexical_index is None:
+        return
+    total = collection.count()
+    if lexical_index.count(property_id) >= total:
+        return
+    logging.info(f"Building the lexical index of property '{property_id}' from {total} stored chunks.")
+    with span("lexical.sync", chunks=total):
+        for offset in range(0, total, page_size):
+            page = collection.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+            lexical_index.upsert(property_id, page["ids"], page["documents"], page["metadatas"])
+
+def query_collection(prompt: str, n_results: int = 10, where: Optional[dict] = None,
+                     property_id: str = DEFAULT_PROPERTY, raise_errors: bool = False):
+    """
+    Queries the vector collection with a given prompt to retrieve relevant documents and their distances.
+    An optional `where` clause pre-filters candidates by row metadata before the vector search; if it
+    matches nothing, the query is repeated unfiltered. Only the property's own collection is searched.
+    Errors are shown and None returned, or raised with `raise_errors` (off the Streamlit script
+    thread, where `st.error` would be dropped).
+    """
+    try:
+        collection = get_vector_collection(property_id)
+        if not collection:
+            if raise_errors:
+                raise RuntimeError("Vector store collection could not be initialized.")
+            st.error("Vector store collection could not be initialized.")
             return None
-        results = collection.query(
-            query_texts=[prompt],
-            n_results=n_results,
-            include=['documents', 'distances', 'metadatas']
-        )
+        query_embedding = embed_query(prompt)
+        with span("chroma.query") as counts:
+            results = collection.query(
+                query_embeddings=[query_embedding],
+                n_results=n_results,
+                include=['documents', 'distances', 'metadatas'],
+                where=where,
+            )
+            if where and not results["ids"][0]:
+                logging.info(f"No documents matched filter {where}; retrying without it.")
+                results = collection.query(
+                    query_embeddings=[query_embedding],
+                    n_results=n_results,
+                    include=['documents', 'distances', 'metadatas'],
+                )
+            counts["chunks"] = len(results["ids"][0])
         logging.info(f"Query returned {len(results['documents'][0]) if results and 'documents' in results else 0} results.")
         return results
     except Exception as e:
+        reset_vector_collection()
         logging.error(f"An error occurred while querying the collection: {e}")
+        if raise_errors:
+            raise
         st.error(f"An error occurred while querying the collection: {e}")
         return None
 
-def list_uploaded_documents() -> List[str]:
-    """Lists the names of uploaded documents."""
+def list_uploaded_documents(property_id: str = DEFAULT_PROPERTY) -> List[str]:
+    """Lists the names of a property's uploaded documents from the document registry."""
     try:
-        collection = get_vector_collection()
-        if not collection:
-            return []
-        # Fetch all IDs from the collection
-        all_ids = collection.get()["ids"]
-        # Extract document names from IDs
-        document_names = set([doc_id.rsplit("_", 1)[0] for doc_id in all_ids])
-        return sorted(list(document_names))
+        return list_documents(property_id)
     except Exception as e:
         logging.error(f"An error occurred while listing documents: {e}")
         st.error(f"An error occurred while listing documents: {e}")
         return []
 
-def delete_document(document_name: str):
-    """Deletes all vectors associated with a document."""
+def delete_document(document_name: str, property_id: str = DEFAULT_PROPERTY) -> Optional[bool]:
+    """
+    Deletes all vectors and stored tables associated with a document. Returns True if the
+    document was registered, False if there was nothing to delete, or None if deleting failed
+    (the error is shown). The caller reports the outcome, typically after a rerun.
+    """
     try:
-        collection = get_vector_collection()
+        collection = get_vector_collection(property_id)
         if not collection:
             st.error("Vector store collection could not be initialized.")
-            return
-        # Find all IDs associated with the document
-        all_ids = collection.get()["ids"]
-        ids_to_delete = [
-            doc_id for doc_id in all_ids if doc_id.startswith(f"{document_name}_")
-        ]
-        if ids_to_delete:
-            collection.delete(ids=ids_to_delete)
-            st.success(f"Document '{document_name}' deleted successfully.")
-        else:
-            st.info(f"No data found for document '{document_name}'.")
+            return None
+        registered = document_name in list_documents(property_id)
+        collection.delete(where={"file_name": document_name})
+        lexical_index = get_lexical_index()
+        if lexical_index is not None:
+            lexical_index.delete_file(property_id, document_name)
+        remove_document_entry(document_name, property_id)
+        delete_rate_table(document_name, property_id)
+        delete_aggregates(document_name, property_id)
+        invalidate_answers()
+        return registered
     except Exception as e:
         logging.error(f"An error occurred while deleting the document: {e}")
-        st.error(f"An error occurred while deleting the document: {e}")
\ No newline at end of file
+        st.error(f"An error occurred while deleting the document: {e}")
+        return None
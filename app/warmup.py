@@ -0,0 +1,78 @@
+import time
+import logging
+import threading
+from typing import Callable, Dict, Optional
+
+from manifest import DEFAULT_PROPERTY, list_properties
+from settings import config
+
+_warm_up_lock = threading.Lock()
+_warm_up_thread: Optional[threading.Thread] = None
+
+def _import_dependencies():
+    # chromadb and langchain are imported on first use; pay for them before the first upload or question
+    import chromadb  # noqa: F401
+    import ollama  # noqa: F401
+    from langchain.schema import Document  # noqa: F401
+
+def _load_chat_models():
+    import ollama
+
+    # An empty prompt makes Ollama load the model into memory without generating anything
+    for model in {config["llm_model"], config.get("translation_model", config["llm_model"])}:
+        ollama.generate(model=model, prompt="", keep_alive=config.get("ollama_keep_alive"))
+
+def _load_embedding_model():
+    from vector_store import get_embedding_function
+
+    get_embedding_function()(["warm-up"])
+
+def _open_collections():
+    from vector_store import get_vector_collection, sync_lexical_index
+
+    for property_id in list_properties() or [DEFAULT_PROPERTY]:
+        collection = get_vector_collection(property_id)
+        if collection is not None:
+            # The first count loads the collection's index from disk
+            collection.count()
+            sync_lexical_index(property_id)
+
+WARM_UP_STEPS: Dict[str, Callable[[], None]] = {
+    "imports": _import_dependencies,
+    "chat_model": _load_chat_models,
+    "embedding_model": _load_embedding_model,
+    "collections": _open_collections,
+}
+
+def warm_up() -> Dict[str, Optional[float]]:
+    """
+    Imports the heavy dependencies, loads the chat and embedding models into Ollama and opens
+    every property's Chroma collection and lexical index, so the first question doesn't pay
+    for any of it.
+    Returns the seconds each step took; a failed step (e.g. Ollama not running) is None.
+    """
+    timings = {}
+    for name, step in WARM_UP_STEPS.items():
+        started = time.perf_counter()
+        try:
+            step()
+            timings[name] = round(time.perf_counter() - started, 4)
+        except Exception as e:
+            logging.warning(f"Warm-up step '{name}' failed: {e}")
+            timings[name] = None
+    logging.info(f"Warm-up finished: {timings}")
+    return timings
+
+def start_warm_up() -> Optional[threading.Thread]:
+    """
+    Runs `warm_up()` in a background thread when config `warm_up` is set. Safe to call on
+    every Streamlit rerun; the warm-up runs once per process.
+    """
+    global _warm_up_thread
+    if not config.get("warm_up", False):
+        return None
+    with _warm_up_lock:
+        if _warm_up_thread is None:
+            _warm_up_thread = threading.Thread(target=warm_up, name="warm-up", daemon=True)
+            _warm_up_thread.start()
+        return _warm_up_thread
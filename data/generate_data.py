@@ -1,34 +1,110 @@
+"""
+Generates synthetic comp set files in the format the assistant ingests.
+
+Usage:
+
+    python data/generate_data.py                                  # 30 days x 5 competitors -> hotel_competitor_rates.csv
+    python data/generate_data.py --days 10000 --competitors 12 --seed 7 --output big.csv
+    python data/generate_data.py --properties 40 --days 365 --output rate_shops/   # one file per property
+"""
+import os
+import argparse
+import string
+from typing import List, Optional
+
+import numpy as np
 import pandas as pd
-import random
-from datetime import datetime, timedelta
-
-# Generate date range for one month
-start_date = datetime(2024, 1, 1)
-end_date = start_date + timedelta(days=29)
-date_range = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
-
-# Generate hotel data for testing
-data = {
-    "Date": [date.strftime("%Y-%m-%d") for date in date_range],
-    "Your Rate": [random.randint(100, 200) for _ in date_range],
-    "Competitor A Rate": [random.randint(95, 205) for _ in date_range],
-    "Competitor B Rate": [random.randint(90, 195) for _ in date_range],
-    "Competitor C Rate": [random.randint(85, 210) for _ in date_range],
-    "Competitor D Rate": [random.randint(110, 220) for _ in date_range],
-    "Competitor E Rate": [random.randint(120, 230) for _ in date_range],
-    "Min LOS": [random.randint(1, 3) for _ in date_range],  # Minimum Length of Stay
-    "Advance Purchase": [random.randint(7, 30) for _ in date_range],  # Advance Purchase in days
-}
-
-# Create a DataFrame
-df = pd.DataFrame(data)
-
-# Add a consolidated "Competitor Rates" column as an average of all competitors
-competitor_columns = ["Competitor A Rate", "Competitor B Rate", "Competitor C Rate", "Competitor D Rate", "Competitor E Rate"]
-df["Competitor Rates"] = df[competitor_columns].mean(axis=1)
-
-# Save as a CSV file
-file_path = "hotel_competitor_rates.csv"
-df.to_csv(file_path, index=False)
-
-print(f"CSV file saved at: {file_path}")
\ No newline at end of file
+
+def competitor_names(count: int) -> List[str]:
+    """Competitor A ... Z, then AA, AB, ... like spreadsheet columns."""
+    names = []
+    for i in range(count):
+        label, n = "", i
+        while True:
+            label = string.ascii_uppercase[n % 26] + label
+            n = n // 26 - 1
+            if n < 0:
+                break
+        names.append(f"Competitor {label} Rate")
+    return names
+
+def generate_comp_set(
+    days: int = 30,
+    competitors: int = 5,
+    start_date: str = "2024-01-01",
+    seed: Optional[int] = None,
+    missing_rate: float = 0.0,
+    outlier_rate: float = 0.0,
+) -> pd.DataFrame:
+    """
+    Generates one property's comp set: own rate, per-competitor rates, restrictions and the
+    consolidated "Competitor Rates" column. `missing_rate` blanks that share of competitor
+    rates (sold out / not shopped); `outlier_rate` multiplies that share of them by 0.3 or 3.
+    The same seed always produces the same file.
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(start_date, periods=days, freq="D")
+    data = {
+        "Date": dates.strftime("%Y-%m-%d"),
+        "Your Rate": rng.integers(100, 201, days),
+    }
+    comp_columns = competitor_names(competitors)
+    for col in comp_columns:
+        # Each competitor prices around its own level, like the original five fixed ranges
+        low = int(rng.integers(85, 121))
+        data[col] = rng.integers(low, low + 111, days).astype("float64")
+    data["Min LOS"] = rng.integers(1, 4, days)  # Minimum Length of Stay
+    data["Advance Purchase"] = rng.integers(7, 31, days)  # Advance Purchase in days
+    df = pd.DataFrame(data)
+
+    rates = df[comp_columns].to_numpy(copy=True)
+    if outlier_rate > 0:
+        outliers = rng.random(rates.shape) < outlier_rate
+        rates[outliers] = np.round(rates[outliers] * rng.choice([0.3, 3.0], outliers.sum()))
+    if missing_rate > 0:
+        rates[rng.random(rates.shape) < missing_rate] = np.nan
+    df[comp_columns] = rates
+
+    # Add a consolidated "Competitor Rates" column as an average of all competitors
+    df["Competitor Rates"] = df[comp_columns].mean(axis=1).round(2)
+    return df
+
+def generate_portfolio(output_dir: str, properties: int, seed: Optional[int] = None, **kwargs) -> List[str]:
+    """Writes one comp set file per property (`property_001.csv`, ...) and returns their paths."""
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for i in range(properties):
+        path = os.path.join(output_dir, f"property_{i + 1:03d}.csv")
+        generate_comp_set(seed=None if seed is None else seed + i, **kwargs).to_csv(path, index=False, float_format="%g")
+        paths.append(path)
+    return paths
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Generate synthetic comp set data.")
+    parser.add_argument("--days", type=int, default=30, help="Number of stay dates (rows) per property")
+    parser.add_argument("--competitors", type=int, default=5, help="Number of competitors")
+    parser.add_argument("--properties", type=int, default=1, help="Number of properties (one file each)")
+    parser.add_argument("--start-date", default="2024-01-01", help="First stay date")
+    parser.add_argument("--seed", type=int, help="Random seed for reproducible data")
+    parser.add_argument("--missing-rate", type=float, default=0.0, help="Share of missing competitor rates")
+    parser.add_argument("--outlier-rate", type=float, default=0.0, help="Share of outlier competitor rates")
+    parser.add_argument("--output", default="hotel_competitor_rates.csv",
+                        help="Output CSV, or a directory when generating several properties")
+    args = parser.parse_args(argv)
+
+    options = dict(
+        days=args.days,
+        competitors=args.competitors,
+        start_date=args.start_date,
+        missing_rate=args.missing_rate,
+        outlier_rate=args.outlier_rate,
+    )
+    if args.properties > 1:
+        paths = generate_portfolio(args.output, args.properties, seed=args.seed, **options)
+        print(f"{len(paths)} CSV files saved in: {args.output}")
+    else:
+        generate_comp_set(seed=args.seed, **options).to_csv(args.output, index=False, float_format="%g")
+        print(f"CSV file saved at: {args.output}")
+
+if __name__ == "__main__":
+    main()
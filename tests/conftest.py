@@ -0,0 +1,22 @@
+import os
+import sys
+import tempfile
+
+# The app modules read config.yaml from the working directory on import; point every store
+# at a scratch directory before any test imports them
+_workspace = tempfile.mkdtemp(prefix="revenue-tests-")
+with open(os.path.join(_workspace, "config.yaml"), "w") as f:
+    f.write(
+        f"llm_model: test\n"
+        f"embedding_model: test\n"
+        f"ollama_url: http://127.0.0.1:1/api/embeddings\n"
+        f"vector_store_path: {_workspace}/vector_store\n"
+        f"rate_store_path: {_workspace}/rate_store\n"
+        f"manifest_path: {_workspace}/manifest.json\n"
+        f"row_hash_store_path: {_workspace}/row_hashes\n"
+        f"cache_path: {_workspace}/cache.db\n"
+        f"lexical_index_path: {_workspace}/lexical_index.sqlite3\n"
+        f"snapshot_store_path: {_workspace}/snapshots\n"
+    )
+os.chdir(_workspace)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
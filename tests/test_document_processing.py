@@ -0,0 +1,46 @@
+import io
+
+from document_processing import _batch_to_documents
+from rate_store import build_rate_table, iter_comp_set_batches
+
+# The missing rate on 2024-01-04 turns "Your Rate" into a float column in its batch only
+COMP_SET_CSV = """Date,Your Rate,Competitor Rates,Min LOS,Advance Purchase
+2024-01-01,94,101.5,1,0
+2024-01-02,96,99,1,0
+2024-01-03,98,104,2,7
+2024-01-04,,97,,0
+2024-01-05,102,110,1,0
+2024-01-06,104,108,3,14
+"""
+
+def _row_documents(batch_size: int) -> dict:
+    documents = {}
+    for df in iter_comp_set_batches(io.StringIO(COMP_SET_CSV), batch_size, file_name="comp_set.csv"):
+        for doc in _batch_to_documents(df, build_rate_table(df), "comp_set.csv", "default"):
+            documents[doc.metadata["date"]] = doc
+    return documents
+
+def test_row_text_and_hash_do_not_depend_on_batch_window():
+    whole = _row_documents(batch_size=6)
+    shifted = _row_documents(batch_size=4)
+
+    assert set(whole) == set(shifted)
+    for date, doc in whole.items():
+        assert shifted[date].page_content == doc.page_content
+        assert shifted[date].metadata["row_hash"] == doc.metadata["row_hash"]
+    assert whole["2024-01-01"].page_content.endswith("\n2024-01-01,94,101.5,1,0")
+    assert whole["2024-01-04"].page_content.endswith("\n2024-01-04,,97,,0")
+
+def test_renamed_column_changes_the_row_hash():
+    def row_hashes(csv: str) -> dict:
+        df = next(iter_comp_set_batches(io.StringIO(csv), 10, file_name="comp_set.csv"))
+        return {doc.metadata["date"]: doc.metadata["row_hash"]
+                for doc in _batch_to_documents(df, build_rate_table(df), "comp_set.csv", "default")}
+
+    header, *rows = COMP_SET_CSV.splitlines()
+    with_competitor = "\n".join([f"{header},Competitor A Rate", *(f"{row},99" for row in rows)])
+    renamed = with_competitor.replace("Competitor A Rate", "Competitor B Rate")
+
+    before, after = row_hashes(with_competitor), row_hashes(renamed)
+    assert before.keys() == after.keys()
+    assert all(before[date] != after[date] for date in before)
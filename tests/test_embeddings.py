@@ -0,0 +1,12 @@
+import pytest
+
+from embeddings import ollama_base_url
+
+@pytest.mark.parametrize("url", [
+    "http://localhost:11434",
+    "http://localhost:11434/",
+    "http://localhost:11434/api/embeddings",
+    "http://localhost:11434/api/embed",
+])
+def test_ollama_base_url_accepts_base_and_endpoint_urls(url):
+    assert ollama_base_url(url) == "http://localhost:11434"
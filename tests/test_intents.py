@@ -0,0 +1,34 @@
+import io
+
+import pandas as pd
+import pytest
+
+from intents import route_question
+from rate_store import build_rate_table, competitor_columns, competitor_rate_extremes, read_comp_set
+
+COMP_SET_CSV = """Date,Your Rate,Competitor Rates,Competitor A Rate,Competitor B Rate,Min LOS,Advance Purchase
+2024-01-01,94,100,101.5,98,1,0
+2024-01-02,96,100,99,103,1,0
+2024-01-03,98,100,104,97,2,7
+"""
+
+@pytest.fixture
+def table() -> pd.DataFrame:
+    return build_rate_table(read_comp_set(io.StringIO(COMP_SET_CSV), file_name="comp_set.csv"))
+
+@pytest.mark.parametrize("question", [
+    "lowest competitor rate next week?",
+    "highest competitor rate from 2030-01-01 to 2030-01-07?",
+])
+def test_competitor_rate_extremes_of_an_empty_date_range(table, question):
+    result = route_question(question, table)
+
+    assert result.frame.empty
+    assert "Date" in result.frame.columns
+    assert result.summary == "No competitor rates found."
+
+def test_competitor_rate_extremes_without_competitor_rates(table):
+    table[competitor_columns(table)] = float("nan")
+
+    assert competitor_rate_extremes(table).index.name == "Date"
+    assert route_question("highest competitor rate?", table).frame.empty
@@ -0,0 +1,37 @@
+import json
+
+import pytest
+
+import manifest
+
+@pytest.fixture(autouse=True)
+def manifest_paths(tmp_path, monkeypatch):
+    monkeypatch.setattr(manifest, "MANIFEST_PATH", str(tmp_path / "manifest.json"))
+    monkeypatch.setattr(manifest, "ROW_HASH_STORE_PATH", str(tmp_path / "row_hashes"))
+
+def test_row_hashes_are_kept_out_of_the_registry():
+    manifest.update_document_entry("a.csv", "content", {"2024-01-01": "row"}, "hotel")
+
+    with open(manifest.MANIFEST_PATH) as f:
+        assert json.load(f) == {"hotel": {"a.csv": {"content_hash": "content"}}}
+    assert manifest.load_row_hashes("a.csv", "hotel") == {"2024-01-01": "row"}
+
+    manifest.update_document_entry("a.csv", "changed", {"2024-01-02": "row"}, "hotel")
+    assert manifest.get_document_entry("a.csv", "hotel") == {"content_hash": "changed"}
+    assert manifest.load_row_hashes("a.csv", "hotel") == {"2024-01-02": "row"}
+
+    manifest.remove_document_entry("a.csv", "hotel")
+    assert manifest.list_documents("hotel") == []
+    assert manifest.load_row_hashes("a.csv", "hotel") == {}
+
+def test_inline_row_hashes_of_old_manifests_are_moved_out_on_save():
+    with open(manifest.MANIFEST_PATH, "w") as f:
+        json.dump({"a.csv": {"content_hash": "a", "rows": {"2024-01-01": "row"}},
+                   "b.csv": {"content_hash": "b", "rows": {"2024-01-02": "row"}}}, f)
+
+    assert manifest.load_row_hashes("b.csv") == {"2024-01-02": "row"}
+    manifest.update_document_entry("a.csv", "a2", {}, manifest.DEFAULT_PROPERTY)
+
+    with open(manifest.MANIFEST_PATH) as f:
+        assert json.load(f) == {"default": {"a.csv": {"content_hash": "a2"}, "b.csv": {"content_hash": "b"}}}
+    assert manifest.load_row_hashes("b.csv") == {"2024-01-02": "row"}